@@ -0,0 +1,141 @@
+"""Benchmark of the compiled label rules against the previous per-call mapping functions.
+
+Run from the repository root: python3 benchmarks/label_benchmark.py [-n ISSUES]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.migrationutils as migrationutils
+
+
+def legacy_type_map(gh_labels):
+    type_map = {"task": "Task", "bug": "Bug", "user_story": "Story", "Epic": "Epic"}
+
+    for label in gh_labels:
+        label_name = str(label["name"])
+        if label_name in type_map:
+            return type_map[label_name]
+
+    return "Task"
+
+
+def legacy_priority_map(gh_labels):
+    priority_map = {
+        "blocker (P0)": "Blocker",
+        "Priority/P1": "Critical",
+        "Priority/P2": "Normal",
+        "Priority/P3": "Minor",
+    }
+
+    priority = {"name": "Undefined"}
+
+    for label in gh_labels:
+        label_name = str(label["name"])
+        if label_name in priority_map:
+            if priority_map[label_name] != "":
+                priority["name"] = priority_map[label_name]
+                break
+
+    return priority
+
+
+def legacy_severity_map(gh_labels):
+    severity_map = {
+        "Severity 1 - Urgent": "Critical",
+        "Severity 2 - Major": "Moderate",
+        "Severity 3 - Minor": "Low",
+    }
+
+    severity = {}
+
+    for label in gh_labels:
+        label_name = str(label["name"])
+        if label_name in severity_map:
+            if severity_map[label_name] != "":
+                severity["value"] = severity_map[label_name]
+                break
+
+    if "value" in severity:
+        return severity
+
+    return None
+
+
+def legacy_resolve(gh_labels):
+    """The label handling previously done for each issue"""
+
+    labels = []
+    for label in gh_labels:
+        label_name = str(label["name"])
+        labels.append(label_name.replace(" ", "_"))
+
+    return {
+        "type": legacy_type_map(gh_labels),
+        "priority": legacy_priority_map(gh_labels),
+        "severity": legacy_severity_map(gh_labels),
+        "labels": labels,
+    }
+
+
+def build_label_sets(count):
+    """Return the labels of count synthetic issues"""
+
+    random.seed(0)
+    names = (
+        list(migrationutils.default_type_map)
+        + list(migrationutils.default_priority_map)
+        + list(migrationutils.default_severity_map)
+        + [
+            "Migrated",
+            "wontfix",
+            "needs triage",
+            "area/api",
+            "area/ui",
+            "good first issue",
+        ]
+        + [f"team/{index}" for index in range(40)]
+    )
+
+    return [
+        [{"name": name} for name in random.sample(names, random.randint(0, 8))]
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--issues", type=int, default=100000)
+    args = parser.parse_args()
+
+    label_sets = build_label_sets(args.issues)
+    rules = migrationutils.LabelRules()
+
+    start = time.perf_counter()
+    legacy_results = [legacy_resolve(labels) for labels in label_sets]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [rules.resolve(labels) for labels in label_sets]
+    rules_time = time.perf_counter() - start
+
+    mismatches = sum(
+        legacy != result for legacy, result in zip(legacy_results, results)
+    )
+    print(f"* Parity: {len(results) - mismatches}/{len(results)} issues")
+    print(
+        f"* {len(label_sets)} issues: legacy {legacy_time * 1000:.1f} ms, "
+        f"label rules {rules_time * 1000:.1f} ms ({legacy_time / rules_time:.1f}x)"
+    )
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
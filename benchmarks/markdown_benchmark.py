@@ -0,0 +1,154 @@
+"""Micro-benchmark of the Markdown to Jira converter against the previous multi-pass one.
+
+Run from the repository root: python3 benchmarks/markdown_benchmark.py [-n ROUNDS] [FILE ...]
+Files given as arguments are added to the generated corpus of large issue bodies.
+"""
+
+import os
+import re
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.jirautils as jirautils
+
+
+def legacy_convert(string, replace_image):
+    """The multi-pass converter previously used by convert_gh_to_jira_markdown"""
+
+    string = re.sub(
+        r"!\[(.*?)\]\((.*?)\)", lambda m: replace_image(*m.groups()), string
+    )
+    string = re.sub(r"\[(.*?)\]\((.*?)\)", r"[\1|\2]", string)
+    string = re.sub(r"(###### )", "h6. ", string)
+    string = re.sub(r"(##### )", "h5. ", string)
+    string = re.sub(r"(#### )", "h4. ", string)
+    string = re.sub(r"(### )", "h3. ", string)
+    string = re.sub(r"(## )", "h2. ", string)
+    string = re.sub(r"(# )", "h1. ", string)
+    string = string.replace("**", "*")
+    string = re.sub(r"`([^`\n]+?)`", r"{{\1}}", string)
+    string = re.sub(
+        r"```(\w+)\n(.*?)```",
+        lambda m: f"{{code:{m.group(1)}}}{m.group(2)}{{code}}",
+        string,
+        flags=re.DOTALL,
+    )
+    string = re.sub(r"```(.*?)```", r"{code}\1{code}", string, flags=re.DOTALL)
+    string = re.sub(r"^> (.*)$", r"{quote}\1{quote}", string, flags=re.MULTILINE)
+    string = re.sub(
+        r"^(\s*)[-*] (.*)$",
+        lambda m: f"{m.group(1)}* {m.group(2)}",
+        string,
+        flags=re.MULTILINE,
+    )
+    string = re.sub(
+        r"^(\s*)\d+\. (.*)$",
+        lambda m: f"{m.group(1)}# {m.group(2)}",
+        string,
+        flags=re.MULTILINE,
+    )
+
+    return string
+
+
+def replace_image(alt_text, url):
+    """Stand-in for the image cache, returns a placeholder without downloading"""
+
+    return f"!{url.split('/')[-1]}.png!"
+
+
+# Inputs the previous converter already handled correctly, both must agree on them
+parity_cases = [
+    "plain text without markup",
+    "# Title\n## Subtitle\n###### Deep title",
+    "Some **bold** words and **more bold**",
+    "Use `make build` then `make test`",
+    "See [the docs](https://example.com/docs) and [issue](https://example.com/1)",
+    "![screenshot](https://github.com/user-attachments/assets/1234)",
+    "[![badge](https://example.com/badge)](https://example.com)",
+    "> quoted line\n> second **quoted** line",
+    "- first\n- second\n  - nested\n* star item",
+    "1. first\n2. second\n   3. nested",
+    "```python\nprint('hello')\n```",
+    "```\nno language\n```",
+    "Mixed: **bold** with `code` and [link](https://example.com)\n\n- item **one**\n1. step",
+]
+
+
+def build_corpus(paths):
+    """Return large issue bodies mixing every construct the converter handles"""
+
+    section = (
+        "## Steps to reproduce\n\n"
+        "1. Open the **dashboard** and click [settings](https://example.com/settings)\n"
+        "2. Run `migrate --all` from the terminal\n"
+        "   - with the *default* profile\n"
+        "   - and **verbose** logs\n\n"
+        "> The error only appears on large projects\n\n"
+        "![trace](https://github.com/user-attachments/assets/abcdef)\n\n"
+        "```python\n# not a header\nfor item in items:\n    print(item)  # **not bold**\n```\n\n"
+        "Plain paragraph text that needs no conversion at all, repeated to pad the body. "
+        * 4
+        + "\n\n"
+    )
+    prose = (
+        "Mostly prose, as in long bug reports and design discussions, with a rare "
+        "**highlight** every few lines and no other markup to convert.\n"
+        + "x " * 60
+        + "\n"
+    )
+    corpus = [section * 50, section * 200, section * 800, prose * 2000]
+
+    for path in paths:
+        with open(path) as file:
+            corpus.append(file.read())
+
+    return corpus
+
+
+def check_parity():
+    """Return the parity cases on which both converters disagree"""
+
+    return [
+        case
+        for case in parity_cases
+        if jirautils.convert_markdown(case, replace_image)
+        != legacy_convert(case, replace_image)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--rounds", type=int, default=20)
+    parser.add_argument("files", nargs="*", help="Extra Markdown files to convert")
+    args = parser.parse_args()
+
+    mismatches = check_parity()
+    for case in mismatches:
+        print(f"* Parity mismatch for {case!r}:")
+        print(f"  legacy: {legacy_convert(case, replace_image)!r}")
+        print(f"  new:    {jirautils.convert_markdown(case, replace_image)!r}")
+    print(f"* Parity: {len(parity_cases) - len(mismatches)}/{len(parity_cases)} cases")
+
+    for body in build_corpus(args.files):
+        legacy_time = timeit.timeit(
+            lambda: legacy_convert(body, replace_image), number=args.rounds
+        )
+        new_time = timeit.timeit(
+            lambda: jirautils.convert_markdown(body, replace_image), number=args.rounds
+        )
+        print(
+            f"* {len(body):>9} chars: legacy {legacy_time / args.rounds * 1000:8.2f} ms, "
+            f"single pass {new_time / args.rounds * 1000:8.2f} ms "
+            f"({legacy_time / new_time:.1f}x)"
+        )
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""End-to-end throughput benchmark of the migration against the local GitHub and Jira mocks.
+
+Run from the repository root: python3 benchmarks/migration_benchmark.py [-n ISSUES ...] [-w WORKERS]
+Each size migrates a new synthetic backlog with jira-migration.py in a child process
+and reports issues/sec, requests per issue, peak RSS and retries. With --baseline,
+the run fails when throughput drops below a previous --output file. With --rerun,
+each backlog is migrated again after its completion labels are removed, and the
+run fails if the second migration creates Jira issues again.
+"""
+
+import os
+import sys
+import json
+import time
+import runpy
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(benchmark_dir)
+sys.path.insert(0, benchmark_dir)
+
+import mock_server
+
+
+def get_backlogs(size, repos):
+    """Return the backlog of a run, split into a dict of backlogs per org/repo for several repos"""
+
+    if repos == 1:
+        return mock_server.Backlog(size)
+
+    return {
+        f"benchmark/repo{index}": mock_server.Backlog(
+            size // repos, seed=index, node_prefix=f"I{index}"
+        )
+        for index in range(repos)
+    }
+
+
+def get_config(github_server, jira_server, backend, client_rate, backlogs=None):
+    """Return the config.json of a benchmark run"""
+
+    config = {
+        "label_filter": "to-migrate",
+        "label_exclusions": mock_server.excluded_label,
+        "completion_label": "Migrated",
+        "default_jira_user": "acc-default",
+        "github_backend": backend,
+        "rate_limits": {
+            github_server.url.split("//")[1]: client_rate,
+            jira_server.url.split("//")[1]: client_rate,
+        },
+        # The mocks have no secondary rate limit on content creation
+        "writeback_comments_per_minute": 1000000,
+    }
+    if isinstance(backlogs, dict):
+        config["targets"] = [
+            {"repo": org_repo, "project_key": f"P{index}"}
+            for index, org_repo in enumerate(backlogs)
+        ]
+
+    return config
+
+
+def run_migration(github_url, jira_url, workers):
+    """Run jira-migration.py against the mock servers (in the child process)"""
+
+    # migrationauth.py and config.json are written to the working directory of the run
+    sys.path[:0] = [os.getcwd(), repo_dir]
+    mock_server.point_utils_at(github_url, jira_url)
+    sys.argv = ["jira-migration.py", "-w", str(workers)]
+    runpy.run_path(os.path.join(repo_dir, "jira-migration.py"), run_name="__main__")
+
+
+def run_child(command, work_dir, log_path):
+    """Run a migration child process, exit on failure, return its resource usage"""
+
+    with open(log_path, "w") as log_file:
+        process = subprocess.Popen(
+            command, cwd=work_dir, stdout=log_file, stderr=subprocess.STDOUT
+        )
+        _, status, usage = os.wait4(process.pid, 0)
+
+    if status != 0:
+        with open(log_path) as log_file:
+            print("".join(log_file.readlines()[-20:]))
+        print(f"* Error: Migration failed (status {status})")
+        sys.exit(1)
+
+    return usage
+
+
+def benchmark(size, args):
+    """Migrate a synthetic backlog of size issues and return the run metrics"""
+
+    backlogs = get_backlogs(size, args.repos)
+    github_server, jira_server = mock_server.start_servers(
+        backlogs,
+        latency=args.latency,
+        rate_limit=args.rate_limit,
+        failure_rate=args.failure_rate,
+    )
+    work_dir = tempfile.mkdtemp(prefix="migration_benchmark_")
+
+    try:
+        shutil.copy(
+            os.path.join(repo_dir, "migrationauth_template.py"),
+            os.path.join(work_dir, "migrationauth.py"),
+        )
+        with open(os.path.join(work_dir, "config.json"), "w") as config_file:
+            json.dump(
+                get_config(
+                    github_server,
+                    jira_server,
+                    args.backend,
+                    args.client_rate,
+                    backlogs,
+                ),
+                config_file,
+            )
+        user_map = {
+            mock_server.get_login(index): mock_server.get_account_id(
+                mock_server.get_login(index)
+            )
+            for index in range(mock_server.user_count)
+        }
+        with open(os.path.join(work_dir, "user_map.json"), "w") as user_map_file:
+            json.dump(user_map, user_map_file)
+
+        log_path = os.path.join(work_dir, "migration.log")
+        command = [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--run",
+            github_server.url,
+            jira_server.url,
+            "-w",
+            str(args.workers),
+        ]
+        start = time.perf_counter()
+        usage = run_child(command, work_dir, log_path)
+        elapsed = time.perf_counter() - start
+
+        github_stats = github_server.get_stats()
+        jira_stats = jira_server.get_stats()
+        if not isinstance(backlogs, dict):
+            backlogs = {"": backlogs}
+        migrated = sum(
+            backlog.count_labelled("Migrated") for backlog in backlogs.values()
+        )
+
+        # Without completion labels nor journal, only the Jira index prevents duplicates
+        recreated = None
+        if args.rerun:
+            created = jira_server.data.issue_count
+            for backlog in backlogs.values():
+                backlog.remove_added_labels()
+            run_child(command, work_dir, log_path)
+            recreated = jira_server.data.issue_count - created
+    finally:
+        github_server.stop()
+        jira_server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    requests = github_stats["requests"] + jira_stats["requests"]
+
+    return {
+        "issues": size,
+        "expected": sum(
+            backlog.get_expected_count([mock_server.excluded_label])
+            for backlog in backlogs.values()
+        ),
+        "migrated": migrated,
+        "seconds": elapsed,
+        "issues_per_second": migrated / elapsed,
+        "requests_per_issue": requests / max(migrated, 1),
+        "github_requests": github_stats["routes"],
+        "jira_requests": jira_stats["routes"],
+        # Every rejected request is retried by httputils
+        "retries": github_stats["errors"] + jira_stats["errors"],
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+        "recreated": recreated,
+    }
+
+
+def check_baseline(results, baseline_path, tolerance):
+    """Return the sizes whose throughput regressed compared to a baseline file"""
+
+    with open(baseline_path) as baseline_file:
+        baseline = {result["issues"]: result for result in json.load(baseline_file)}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["issues"])
+        if previous and result["issues_per_second"] < previous["issues_per_second"] * (
+            1 - tolerance
+        ):
+            print(
+                f"* Regression for {result['issues']} issues: "
+                f"{result['issues_per_second']:.1f} issues/s instead of "
+                f"{previous['issues_per_second']:.1f}"
+            )
+            regressions.append(result["issues"])
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-n", "--issues", type=int, nargs="+", default=[1000, 10000, 50000]
+    )
+    parser.add_argument("-w", "--workers", type=int, default=8)
+    parser.add_argument(
+        "--repos",
+        type=int,
+        default=1,
+        help="Split the backlog across this many repositories, each to its own project",
+    )
+    parser.add_argument(
+        "--backend", choices=["rest", "graphql", "search"], default="rest"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Seconds added to every request"
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=0,
+        help="Requests per minute per server (0: unlimited)",
+    )
+    parser.add_argument(
+        "--failure-rate", type=float, default=0, help="Share of requests failing"
+    )
+    parser.add_argument(
+        "--image-size",
+        type=int,
+        default=mock_server.image_size,
+        help="Size in bytes of the images served by the GitHub mock",
+    )
+    parser.add_argument(
+        "--client-rate",
+        type=float,
+        default=10000,
+        help="Requests per second allowed by the rate_limits config key",
+    )
+    parser.add_argument(
+        "--rerun",
+        action="store_true",
+        help="Migrate each backlog again without completion labels, fail on duplicates",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument("--output", help="Write the results to a JSON file")
+    parser.add_argument("--baseline", help="Fail if slower than this results file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        return run_migration(*args.run, args.workers)
+
+    mock_server.image_size = args.image_size
+
+    results = []
+    for size in args.issues:
+        result = benchmark(size, args)
+        results.append(result)
+        print(
+            f"* {size:>6} issues: {result['seconds']:7.1f} s, "
+            f"{result['issues_per_second']:7.1f} issues/s, "
+            f"{result['requests_per_issue']:5.1f} requests/issue, "
+            f"peak RSS {result['peak_rss_mb']:6.1f} MB, {result['retries']} retries, "
+            f"{result['migrated']}/{result['expected']} migrated"
+        )
+        if args.rerun:
+            print(f"  Rerun: {result['recreated']} Jira issues created again")
+        if args.verbose:
+            print(f"  GitHub: {result['github_requests']}")
+            print(f"  Jira:   {result['jira_requests']}")
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    incomplete = [
+        result
+        for result in results
+        if result["migrated"] < result["expected"] or result["recreated"]
+    ]
+    regressions = []
+    if args.baseline:
+        regressions = check_baseline(results, args.baseline, args.tolerance)
+
+    if incomplete or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
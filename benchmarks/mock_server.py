@@ -0,0 +1,860 @@
+"""Local stand-in for the GitHub and Jira APIs used by the migration, for benchmarks.
+
+Run from the repository root: python3 benchmarks/mock_server.py [-n ISSUES] [--latency SECONDS] ...
+Both servers serve a synthetic backlog generated from the issue numbers, with
+configurable latency, rate-limit headers and failure injection.
+"""
+
+import re
+import json
+import bisect
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+# Labels of the synthetic issues, on top of the label every issue is filtered by
+type_labels = ["bug", "task", "user_story", "Epic"]
+priority_labels = ["blocker (P0)", "Priority/P1", "Priority/P2", "Priority/P3"]
+other_labels = ["area/api", "area/ui", "needs triage", "good first issue"]
+excluded_label = "wontfix"
+
+# Create metadata of the Jira project, matching the default label mapping tables
+issue_types = ["Task", "Bug", "Story", "Epic"]
+priorities = ["Blocker", "Critical", "Normal", "Minor", "Undefined"]
+
+user_count = 50
+# Author of one comment in 20, which the migration skips (ghutils.ignored_comment_users)
+bot_login = "stale[bot]"
+image_count = 500
+image_size = 20 * 1024
+png_header = b"\x89PNG\r\n\x1a\n"
+
+
+def get_login(index):
+    return f"user{index}"
+
+
+def get_account_id(login):
+    return f"acc-{login}"
+
+
+def get_actor(user):
+    """Return a REST user as a GraphQL actor, whose login lacks the [bot] suffix of apps"""
+
+    login = user["login"]
+    if login.endswith("[bot]"):
+        return {"__typename": "Bot", "login": login[: -len("[bot]")]}
+    return {"__typename": "User", "login": login}
+
+
+class Backlog:
+    """Synthetic GitHub issues, generated on demand from their number"""
+
+    def __init__(self, size, label="to-migrate", seed=0, node_prefix="I"):
+        self.size = size
+        self.label = label
+        self.seed = seed
+        # Node IDs are "<node_prefix>_<number>", distinct per repository
+        self.node_prefix = node_prefix
+        self.start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+
+        # Only what filters need is kept for every issue, the rest is generated per request
+        rng = random.Random(seed)
+        self.labels = []
+        self.comment_counts = []
+        self.pull_requests = set()
+        for number in range(1, size + 1):
+            labels = [label, rng.choice(type_labels)]
+            if rng.random() < 0.5:
+                labels.append(rng.choice(priority_labels))
+            if rng.random() < 0.3:
+                labels.append(rng.choice(other_labels))
+            if rng.random() < 0.05:
+                labels.append(excluded_label)
+            self.labels.append(labels)
+            self.comment_counts.append(rng.choice([0, 0, 1, 1, 2, 3, 5, 8]))
+            if rng.random() < 0.02:
+                self.pull_requests.add(number)
+
+        # Labels added by the migration (completion label)
+        self.added_labels = {}
+        self.lock = threading.Lock()
+        self.filters = {}
+
+    def get_labels(self, number):
+        with self.lock:
+            return self.labels[number - 1] + self.added_labels.get(number, [])
+
+    def add_labels(self, number, labels):
+        with self.lock:
+            added = self.added_labels.setdefault(number, [])
+            added.extend(label for label in labels if label not in added)
+
+    def remove_added_labels(self):
+        """Forget the labels added by the migration, as if its GitHub write-back had failed"""
+
+        with self.lock:
+            self.added_labels.clear()
+
+    def count_labelled(self, label):
+        """Return the number of issues the migration added a label to"""
+
+        with self.lock:
+            return sum(label in labels for labels in self.added_labels.values())
+
+    def get_created(self, number):
+        return self.start + timedelta(minutes=number * 5 * 365 * 24 * 60 // self.size)
+
+    def get_updated(self, number):
+        return self.get_created(number) + timedelta(days=number % 30)
+
+    def get_body(self, rng, github_url, paragraphs):
+        """Return a Markdown body mixing the constructs the converter handles"""
+
+        parts = []
+        for index in range(paragraphs):
+            kind = rng.random()
+            if kind < 0.3:
+                parts.append(
+                    "Steps to reproduce:\n\n1. Open the **dashboard**\n"
+                    f"2. Run `migrate --issue {index}`\n   - with the *default* profile"
+                )
+            elif kind < 0.45:
+                parts.append(
+                    f"```python\nfor item in items:\n    print(item, {index})\n```"
+                )
+            elif kind < 0.6:
+                parts.append(
+                    f"![screenshot]({github_url}/images/{rng.randrange(image_count)}.png)"
+                )
+            elif kind < 0.7:
+                parts.append("> The error only appears on large projects")
+            else:
+                parts.append(
+                    "See [the docs](https://example.com/docs) for details. "
+                    + "Plain text of a long bug report. " * rng.randint(1, 20)
+                )
+
+        return "\n\n".join(parts)
+
+    def get_issue(self, number, github_url, org_repo):
+        """Return an issue in the shape of the REST API"""
+
+        rng = random.Random(self.seed * 1000003 + number)
+        issue = {
+            "number": number,
+            "id": number,
+            "node_id": f"{self.node_prefix}_{number}",
+            "title": f"Synthetic issue {number}",
+            "body": f"## Issue {number}\n\n"
+            + self.get_body(rng, github_url, rng.randint(1, 8)),
+            "html_url": f"https://github.com/{org_repo}/issues/{number}",
+            "comments_url": f"{github_url}/repos/{org_repo}/issues/{number}/comments",
+            "state": "open",
+            "user": {"login": get_login(rng.randrange(user_count))},
+            "labels": [{"name": label} for label in self.get_labels(number)],
+            "assignees": [
+                {"login": get_login(rng.randrange(user_count))}
+                for _ in range(rng.choice([0, 1, 1, 2]))
+            ],
+            "comments": self.comment_counts[number - 1],
+            "created_at": self.get_created(number).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "updated_at": self.get_updated(number).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        if number in self.pull_requests:
+            issue["pull_request"] = {"url": f"{github_url}/pulls/{number}"}
+
+        return issue
+
+    def get_comments(self, number, github_url):
+        """Return the comments of an issue in the shape of the REST API"""
+
+        comments = []
+        for index in range(self.comment_counts[number - 1]):
+            rng = random.Random((self.seed * 1000003 + number) * 101 + index)
+            created = self.get_created(number) + timedelta(hours=index + 1)
+            login = get_login(rng.randrange(user_count))
+            if (number + index) % 20 == 0:
+                login = bot_login
+            comments.append(
+                {
+                    "id": number * 1000 + index,
+                    "user": {"login": login},
+                    "body": self.get_body(rng, github_url, rng.randint(1, 3)),
+                    "created_at": created.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                }
+            )
+
+        return comments
+
+    def get_expected_count(self, exclusions):
+        """Return the number of issues a migration should create"""
+
+        return sum(
+            1
+            for number in range(1, self.size + 1)
+            if number not in self.pull_requests
+            and not set(self.labels[number - 1]) & set(exclusions)
+        )
+
+    def find(self, key, predicate):
+        """Return the issue numbers matching a predicate, cached per filter key.
+
+        Filters only look at the synthetic labels, each benchmark run uses a new backlog.
+        """
+
+        with self.lock:
+            numbers = self.filters.get(key)
+        if numbers is None:
+            numbers = [
+                number for number in range(1, self.size + 1) if predicate(number)
+            ]
+            with self.lock:
+                self.filters[key] = numbers
+
+        return numbers
+
+
+class JiraProject:
+    """Issues and comments created in the Jira mock"""
+
+    def __init__(self):
+        self.issue_count = 0
+        self.comment_count = 0
+        self.linked_issues = {}
+        self.lock = threading.Lock()
+
+
+class MockServer(ThreadingHTTPServer):
+    """HTTP server counting requests, with latency, rate limiting and failure injection"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        handler,
+        data,
+        port=0,
+        latency=0,
+        rate_limit=0,
+        rate_window=60,
+        failure_rate=0,
+        seed=0,
+    ):
+        super().__init__(("127.0.0.1", port), handler)
+        self.data = data
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.window_start = 0
+        self.window_count = 0
+        self.requests = {}
+        self.statuses = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def admit(self):
+        """Return the rate-limit headers of a request, and its error status if rejected"""
+
+        now = time.time()
+        with self.lock:
+            if self.failure_rate and self.random.random() < self.failure_rate:
+                return 503, {}
+            if not self.rate_limit:
+                return None, {}
+
+            window_start = now - now % self.rate_window
+            if window_start != self.window_start:
+                self.window_start = window_start
+                self.window_count = 0
+            self.window_count += 1
+            remaining = max(self.rate_limit - self.window_count, 0)
+
+        reset = window_start + self.rate_window
+        headers = {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(math.ceil(reset))),
+        }
+        if self.window_count > self.rate_limit:
+            headers["Retry-After"] = str(int(math.ceil(reset - now)))
+            return 429, headers
+
+        return None, headers
+
+    def count(self, route, status):
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def get_stats(self):
+        """Return the requests served per route and per status"""
+
+        with self.lock:
+            total = sum(self.requests.values())
+            errors = sum(
+                count for status, count in self.statuses.items() if status >= 429
+            )
+            return {
+                "requests": total,
+                "errors": errors,
+                "routes": dict(self.requests),
+                "statuses": dict(self.statuses),
+            }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Dispatch requests to the route methods of a subclass"""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and bodies are written separately, Nagle's algorithm would delay bodies
+    disable_nagle_algorithm = True
+    routes = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_method(self, method):
+        url = urlsplit(self.path)
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.query_lists = parse_qs(url.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        self.body = self.rfile.read(length) if length else b""
+        self.limit_headers = {}
+
+        for route_method, pattern, route in self.routes:
+            match = pattern.fullmatch(url.path)
+            if route_method == method and match:
+                break
+        else:
+            self.server.count("unknown", 404)
+            return self.send_json(404, {"message": "Not Found"})
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        status, self.limit_headers = self.server.admit()
+        if status:
+            self.server.count(route, status)
+            return self.send_json(status, {"message": "Injected failure"})
+
+        status = getattr(self, route)(*match.groups())
+        self.server.count(route, status)
+
+    def do_GET(self):
+        self.handle_method("GET")
+
+    def do_POST(self):
+        self.handle_method("POST")
+
+    def do_PUT(self):
+        self.handle_method("PUT")
+
+    def do_PATCH(self):
+        self.handle_method("PATCH")
+
+    def get_json(self):
+        return json.loads(self.body or b"{}")
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in {**self.limit_headers, **(headers or {})}.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        return status
+
+    def send_json(self, status, data, headers=None):
+        return self.send_body(
+            status, json.dumps(data).encode(), "application/json", headers
+        )
+
+    def get_page_links(self, path, page, last_page):
+        """Return the Link header of a paginated listing"""
+
+        links = []
+        for rel, number in [("next", page + 1), ("last", last_page)]:
+            if rel == "next" and page >= last_page:
+                continue
+            query = dict(self.query, page=number)
+            links.append(f'<{self.server.url}{path}?{urlencode(query)}>; rel="{rel}"')
+
+        return {"Link": ", ".join(links)} if links else {}
+
+
+def route(method, path):
+    return method, re.compile(path)
+
+
+class GitHubHandler(MockHandler):
+    """The REST, search and GraphQL endpoints of GitHub used by ghutils"""
+
+    repo_path = r"/repos/([^/]+/[^/]+)"
+    routes = [
+        (*route("GET", repo_path), "get_repo"),
+        (*route("GET", repo_path + r"/issues"), "list_issues"),
+        (*route("GET", repo_path + r"/issues/(\d+)"), "get_issue"),
+        (*route("PATCH", repo_path + r"/issues/(\d+)"), "update_issue"),
+        (*route("GET", repo_path + r"/issues/(\d+)/comments"), "list_comments"),
+        (*route("POST", repo_path + r"/issues/(\d+)/comments"), "add_comment"),
+        (*route("POST", repo_path + r"/issues/(\d+)/labels"), "add_labels"),
+        (*route("POST", repo_path + r"/labels"), "create_label"),
+        (*route("GET", r"/search/issues"), "search_issues"),
+        (*route("POST", r"/graphql"), "graphql"),
+        (*route("GET", r"/images/(\d+)\.png"), "get_image"),
+    ]
+
+    def get_backlog(self, org_repo):
+        """Return the backlog of a repository, the server data is a backlog or a dict of them"""
+
+        if isinstance(self.server.data, dict):
+            return self.server.data[org_repo]
+        return self.server.data
+
+    def get_node(self, node_id):
+        """Return the backlog and number of an issue node ID"""
+
+        node_prefix, number = node_id.split("_")
+        backlogs = self.server.data
+        if not isinstance(backlogs, dict):
+            return backlogs, int(number)
+        for backlog in backlogs.values():
+            if backlog.node_prefix == node_prefix:
+                return backlog, int(number)
+
+    def get_repo(self, org_repo):
+        return self.send_json(200, {"id": 1, "node_id": "R_1", "full_name": org_repo})
+
+    def send_page(self, numbers, org_repo, headers=None):
+        backlog = self.get_backlog(org_repo)
+        per_page = int(self.query.get("per_page", 30))
+        page = int(self.query.get("page", 1))
+        last_page = max(math.ceil(len(numbers) / per_page), 1)
+        issues = [
+            backlog.get_issue(number, self.server.url, org_repo)
+            for number in numbers[(page - 1) * per_page : page * per_page]
+        ]
+        headers = dict(
+            headers or {}, **self.get_page_links(self.path_only, page, last_page)
+        )
+        return self.send_json(200, issues, headers)
+
+    @property
+    def path_only(self):
+        return urlsplit(self.path).path
+
+    def list_issues(self, org_repo):
+        backlog = self.get_backlog(org_repo)
+        labels = [label for label in self.query.get("labels", "").split(",") if label]
+        since = self.query.get("since")
+        numbers = backlog.find(
+            ("list", tuple(labels), since),
+            lambda number: set(labels) <= set(backlog.labels[number - 1])
+            and (
+                not since
+                or backlog.get_updated(number).strftime("%Y-%m-%dT%H:%M:%SZ") >= since
+            ),
+        )
+        if since:
+            numbers = sorted(numbers, key=backlog.get_updated, reverse=True)
+
+        etag = (
+            '"%s"' % hashlib.sha1(f"{self.query}:{backlog.size}".encode()).hexdigest()
+        )
+        if self.headers.get("If-None-Match") == etag:
+            return self.send_body(304, b"", "application/json", {"ETag": etag})
+
+        return self.send_page(numbers, org_repo, {"ETag": etag})
+
+    def get_issue(self, org_repo, number):
+        backlog = self.get_backlog(org_repo)
+        issue = backlog.get_issue(int(number), self.server.url, org_repo)
+        return self.send_json(200, issue)
+
+    def update_issue(self, org_repo, number):
+        backlog = self.get_backlog(org_repo)
+        issue = backlog.get_issue(int(number), self.server.url, org_repo)
+        issue.update(self.get_json())
+        return self.send_json(200, issue)
+
+    def list_comments(self, org_repo, number):
+        backlog = self.get_backlog(org_repo)
+        comments = backlog.get_comments(int(number), self.server.url)
+        per_page = int(self.query.get("per_page", 30))
+        page = int(self.query.get("page", 1))
+        last_page = max(math.ceil(len(comments) / per_page), 1)
+        return self.send_json(
+            200,
+            comments[(page - 1) * per_page : page * per_page],
+            self.get_page_links(self.path_only, page, last_page),
+        )
+
+    def add_comment(self, org_repo, number):
+        return self.send_json(201, {"id": int(number) * 1000 + 999})
+
+    def add_labels(self, org_repo, number):
+        backlog = self.get_backlog(org_repo)
+        labels = self.get_json().get("labels", [])
+        backlog.add_labels(int(number), labels)
+        return self.send_json(
+            200, [{"name": label} for label in backlog.get_labels(int(number))]
+        )
+
+    def create_label(self, org_repo):
+        name = self.get_json()["name"]
+        return self.send_json(201, {"id": 1, "node_id": f"LA_{name}", "name": name})
+
+    def search_issues(self):
+        query = self.query.get("q", "")
+        org_repo = re.search(r"repo:(\S+)", query).group(1)
+        backlog = self.get_backlog(org_repo)
+        included = set(re.findall(r'(?<!-)label:"([^"]+)"', query))
+        excluded = set(re.findall(r'-label:"([^"]+)"', query))
+        created = re.search(r"created:(\S+)\.\.(\S+)", query)
+        created_since = re.search(r"created:>=(\S+)", query)
+
+        def matches(number):
+            labels = set(backlog.labels[number - 1])
+            if not included <= labels or excluded & labels:
+                return False
+            if "is:issue" in query and number in backlog.pull_requests:
+                return False
+            if created:
+                day = backlog.get_created(number).date().isoformat()
+                return created.group(1) <= day <= created.group(2)
+            return True
+
+        # Only the generated labels are cached, the ones added by the migration are seen at once
+        numbers = backlog.find(
+            ("search", re.sub(r" created:>=\S+", "", query)), matches
+        )
+        if created_since:
+            since = datetime.strptime(created_since.group(1), "%Y-%m-%dT%H:%M:%SZ")
+            numbers = numbers[
+                bisect.bisect_left(
+                    numbers,
+                    since.replace(tzinfo=timezone.utc),
+                    key=backlog.get_created,
+                ) :
+            ]
+        numbers = [
+            number
+            for number in numbers
+            if not excluded & set(backlog.added_labels.get(number, []))
+        ]
+        per_page = int(self.query.get("per_page", 30))
+        page = int(self.query.get("page", 1))
+        items = [
+            backlog.get_issue(number, self.server.url, org_repo)
+            for number in numbers[(page - 1) * per_page : page * per_page]
+        ]
+        return self.send_json(
+            200,
+            {"total_count": len(numbers), "incomplete_results": False, "items": items},
+        )
+
+    def graphql(self):
+        request_data = self.get_json()
+        query = request_data["query"]
+        variables = request_data.get("variables") or {}
+
+        if query.lstrip().startswith("mutation"):
+            data = {}
+            for alias, index in re.findall(r"\b((?:comment|label)(\d+)):", query):
+                if alias.startswith("label"):
+                    backlog, number = self.get_node(variables[f"subject{index}"])
+                    label = variables["label"].split("_", 1)[1]
+                    backlog.add_labels(number, [label])
+                data[alias] = {"clientMutationId": None}
+            return self.send_json(200, {"data": data})
+        if "label(name:" in query:
+            label_id = f"LA_{variables['label']}"
+            return self.send_json(
+                200, {"data": {"repository": {"label": {"id": label_id}}}}
+            )
+        if "node(id:" in query:
+            backlog, number = self.get_node(variables["id"])
+            offset = int(variables.get("cursor") or 0)
+            comments = self.get_comment_page(backlog, number, offset)
+            return self.send_json(200, {"data": {"node": {"comments": comments}}})
+
+        return self.list_issue_nodes(variables)
+
+    def get_comment_page(self, backlog, number, offset):
+        comments = backlog.get_comments(number, self.server.url)
+        page = comments[offset : offset + 100]
+        return {
+            "pageInfo": {
+                "hasNextPage": offset + 100 < len(comments),
+                "endCursor": str(offset + 100),
+            },
+            "nodes": [
+                {
+                    "author": get_actor(comment["user"]),
+                    "body": comment["body"],
+                    "createdAt": comment["created_at"],
+                }
+                for comment in page
+            ],
+        }
+
+    def list_issue_nodes(self, variables):
+        org_repo = f"{variables['owner']}/{variables['name']}"
+        backlog = self.get_backlog(org_repo)
+        labels = set(variables.get("labels") or [])
+        numbers = backlog.find(
+            ("graphql", tuple(sorted(labels))),
+            lambda number: number not in backlog.pull_requests
+            and (not labels or labels & set(backlog.labels[number - 1])),
+        )
+        offset = int(variables.get("cursor") or 0)
+        pagination = variables["pagination"]
+
+        nodes = []
+        for number in numbers[offset : offset + pagination]:
+            issue = backlog.get_issue(number, self.server.url, org_repo)
+            nodes.append(
+                {
+                    "id": issue["node_id"],
+                    "number": number,
+                    "title": issue["title"],
+                    "body": issue["body"],
+                    "url": issue["html_url"],
+                    "author": get_actor(issue["user"]),
+                    "labels": {"nodes": issue["labels"]},
+                    "assignees": {
+                        "nodes": [get_actor(user) for user in issue["assignees"]]
+                    },
+                    "comments": self.get_comment_page(backlog, number, 0),
+                }
+            )
+
+        issues = {
+            "pageInfo": {
+                "hasNextPage": offset + pagination < len(numbers),
+                "endCursor": str(offset + pagination),
+            },
+            "nodes": nodes,
+        }
+        return self.send_json(
+            200, {"data": {"repository": {"databaseId": 1, "issues": issues}}}
+        )
+
+    def get_image(self, index):
+        seed = hashlib.sha256(index.encode()).digest()
+        body = png_header + seed * (image_size // len(seed))
+        return self.send_body(200, body, "image/png")
+
+
+class JiraHandler(MockHandler):
+    """The Jira REST endpoints used by jirautils"""
+
+    api_path = r"/rest/api/latest"
+    routes = [
+        (*route("GET", api_path + r"/user"), "get_user"),
+        (*route("GET", api_path + r"/user/bulk"), "get_users"),
+        (*route("GET", api_path + r"/issue/createmeta"), "get_create_meta"),
+        (*route("POST", api_path + r"/issue"), "create_issue"),
+        (*route("POST", api_path + r"/issue/bulk"), "create_issues"),
+        (*route("GET", api_path + r"/issue/([^/]+)"), "get_issue"),
+        (*route("PUT", api_path + r"/issue/([^/]+)"), "update_issue"),
+        (*route("POST", api_path + r"/issue/([^/]+)/comment"), "add_comment"),
+        (*route("POST", api_path + r"/issue/([^/]+)/attachments"), "add_attachment"),
+        (*route("GET", api_path + r"/issue/([^/]+)/transitions"), "get_transitions"),
+        (*route("POST", api_path + r"/issue/([^/]+)/transitions"), "do_transition"),
+        (*route("POST", api_path + r"/search"), "search_issues"),
+    ]
+
+    def get_user(self):
+        account_id = self.query.get("accountId", "")
+        return self.send_json(200, {"accountId": account_id, "active": True})
+
+    def get_users(self):
+        account_ids = self.query_lists.get("accountId", [])
+        users = [
+            {"accountId": account_id, "active": True} for account_id in account_ids
+        ]
+        return self.send_json(200, {"values": users, "isLast": True})
+
+    def get_create_meta(self):
+        allowed_priorities = [{"name": name} for name in priorities]
+        project = {
+            "key": self.query.get("projectKeys"),
+            "issuetypes": [
+                {
+                    "name": name,
+                    "fields": {"priority": {"allowedValues": allowed_priorities}},
+                }
+                for name in issue_types
+            ],
+        }
+        return self.send_json(200, {"projects": [project]})
+
+    def new_issue(self, fields):
+        project = self.server.data
+        with project.lock:
+            project.issue_count += 1
+            number = project.issue_count
+        key = f"{fields.get('project', {}).get('key', 'MOCK')}-{number}"
+
+        links = {
+            field: value
+            for field, value in fields.items()
+            if field.startswith("customfield_") and value
+        }
+        if links:
+            with project.lock:
+                project.linked_issues[key] = links
+
+        return {
+            "id": str(number),
+            "key": key,
+            "self": f"{self.server.url}/rest/api/latest/issue/{number}",
+        }
+
+    def create_issue(self):
+        return self.send_json(201, self.new_issue(self.get_json()["fields"]))
+
+    def create_issues(self):
+        issue_updates = self.get_json()["issueUpdates"]
+        issues = [self.new_issue(update["fields"]) for update in issue_updates]
+        return self.send_json(201, {"issues": issues, "errors": []})
+
+    def get_issue(self, key):
+        return self.send_json(200, {"id": key, "key": key, "fields": {}})
+
+    def update_issue(self, key):
+        return self.send_body(204, b"", "application/json")
+
+    def add_comment(self, key):
+        project = self.server.data
+        with project.lock:
+            project.comment_count += 1
+            comment_id = project.comment_count
+        return self.send_json(201, {"id": str(comment_id), "body": self.get_json()})
+
+    def add_attachment(self, key):
+        return self.send_json(
+            200, [{"id": key, "filename": "attachment", "size": len(self.body)}]
+        )
+
+    def get_transitions(self, key):
+        return self.send_json(200, {"transitions": []})
+
+    def do_transition(self, key):
+        return self.send_body(204, b"", "application/json")
+
+    def search_issues(self):
+        request_data = self.get_json()
+        fields = request_data.get("fields") or []
+        project = self.server.data
+        with project.lock:
+            issues = [
+                {"key": key, "fields": links}
+                for key, links in project.linked_issues.items()
+                if any(field in links for field in fields)
+            ]
+        start_at = request_data.get("startAt", 0)
+        max_results = request_data.get("maxResults", 50)
+        return self.send_json(
+            200,
+            {
+                "startAt": start_at,
+                "maxResults": max_results,
+                "total": len(issues),
+                "issues": issues[start_at : start_at + max_results],
+            },
+        )
+
+
+def start_servers(backlog, github_port=0, jira_port=0, **options):
+    """Start the GitHub and Jira mock servers in background threads.
+
+    backlog is a Backlog served for every repository, or a dict of them per org/repo.
+    """
+
+    github_server = MockServer(GitHubHandler, backlog, github_port, **options).start()
+    jira_server = MockServer(JiraHandler, JiraProject(), jira_port, **options).start()
+
+    return github_server, jira_server
+
+
+def point_utils_at(github_url, jira_url):
+    """Send the requests of ghutils and jirautils to the mock servers"""
+
+    # Imported here since the utils need the migrationauth module of the run
+    import utils.ghutils as ghutils
+    import utils.jirautils as jirautils
+
+    ghutils.root_url = f"{github_url}/repos"
+    ghutils.base_url = f"{ghutils.root_url}/{ghutils.org_repo}/issues"
+    ghutils.graphql_url = f"{github_url}/graphql"
+    ghutils.search_url = f"{github_url}/search/issues"
+    jirautils.root_url = jira_url
+    jirautils.base_url = f"{jira_url}/rest/api/latest"
+    jirautils.html_url = f"{jira_url}/browse"
+    jirautils.issue_url = f"{jirautils.base_url}/issue"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--issues", type=int, default=1000)
+    parser.add_argument("--github-port", type=int, default=8001)
+    parser.add_argument("--jira-port", type=int, default=8002)
+    parser.add_argument("--latency", type=float, default=0, help="Seconds per request")
+    parser.add_argument(
+        "--rate-limit", type=int, default=0, help="Requests per window (0: unlimited)"
+    )
+    parser.add_argument("--rate-window", type=int, default=60)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    github_server, jira_server = start_servers(
+        Backlog(args.issues),
+        args.github_port,
+        args.jira_port,
+        latency=args.latency,
+        rate_limit=args.rate_limit,
+        rate_window=args.rate_window,
+        failure_rate=args.failure_rate,
+    )
+    print(f"* GitHub mock: {github_server.url}")
+    print(f"* Jira mock:   {jira_server.url}")
+
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in (github_server, jira_server):
+            print(f"* {server.url}: {server.get_stats()}")
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Throughput of the transform stage (mapping and Markdown conversion) per number of processes.
+
+Run from the repository root: python3 benchmarks/transform_benchmark.py [-n ISSUES] [-p PROCESSES ...]
+Synthetic issues are transformed in the calling thread (0 processes) and by the
+transform process pool in batches, as jira-migration.py does with transform_processes.
+"""
+
+import os
+import sys
+import time
+import argparse
+from collections import deque
+
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [benchmark_dir, os.path.dirname(benchmark_dir)]
+
+import markdown_benchmark
+import utils.migrationutils as migrationutils
+
+
+def build_issues(count):
+    """Return synthetic issues with their comment_list and cached image files"""
+
+    section = markdown_benchmark.build_corpus([])[0][:4000]
+    issues = []
+    for number in range(count):
+        comments = [
+            {
+                "id": number * 10 + index,
+                "user": {"login": f"user{index}"},
+                "body": section[: 500 * (index + 1)],
+                "created_at": "2024-01-01T00:00:00Z",
+            }
+            for index in range(4)
+        ]
+        issue = {
+            "number": number,
+            "title": f"Issue {number}",
+            "body": section,
+            "html_url": f"https://github.com/org/repo/issues/{number}",
+            "user": {"login": "user0"},
+            "labels": [{"name": "bug"}, {"name": "Priority/P2"}, {"name": "backend"}],
+            "assignees": [{"login": "user1"}],
+            "comment_list": comments,
+        }
+        image_files = {
+            "https://github.com/user-attachments/assets/abcdef": "images/abcdef.png"
+        }
+        issues.append((issue, image_files))
+
+    return issues
+
+
+def run(issues, processes, batch_size, user_mapping):
+    """Transform every issue, return the wall and CPU seconds"""
+
+    if processes == 0:
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        migrationutils.init_transform(
+            migrationutils.label_rules, "repo", "customfield", user_mapping, "default"
+        )
+        migrationutils.transform_batch(issues)
+        return time.perf_counter() - start, time.process_time() - start_cpu
+
+    pool = migrationutils.start_transform_pool(processes, user_mapping, "default")
+    start = time.perf_counter()
+    cpu_seconds = 0
+    pending = deque()
+    for index in range(0, len(issues), batch_size):
+        pending.append(
+            pool.submit(
+                migrationutils.transform_batch, issues[index : index + batch_size]
+            )
+        )
+        while len(pending) > processes:
+            cpu_seconds += sum(result[2] for result in pending.popleft().result())
+    while pending:
+        cpu_seconds += sum(result[2] for result in pending.popleft().result())
+    seconds = time.perf_counter() - start
+    pool.shutdown()
+
+    return seconds, cpu_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--issues", type=int, default=20000)
+    parser.add_argument(
+        "-p", "--processes", type=int, nargs="+", default=[0, 1, 2, 4, 8]
+    )
+    parser.add_argument("-b", "--batch-size", type=int, default=20)
+    args = parser.parse_args()
+
+    issues = build_issues(args.issues)
+    user_mapping = {f"user{index}": f"acc-user{index}" for index in range(4)}
+    print(f"* {args.issues} issues, {os.cpu_count()} cores")
+
+    baseline = None
+    for processes in args.processes:
+        seconds, cpu_seconds = run(issues, processes, args.batch_size, user_mapping)
+        baseline = baseline or seconds
+        print(
+            f"* {processes:>2} processes: {seconds:6.2f} s, "
+            f"{args.issues / seconds:8.0f} issues/s, cpu {cpu_seconds:6.2f} s "
+            f"({baseline / seconds:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,24 @@
 import utils.ghutils as ghutils
 import utils.jirautils as jirautils
 import utils.migrationutils as migrationutils
+import utils.httputils as httputils
+import utils.journalutils as journalutils
+import utils.cacheutils as cacheutils
+import utils.syncutils as syncutils
+import utils.metricsutils as metricsutils
+import utils.snapshotutils as snapshotutils
+import utils.planutils as planutils
+import hashlib
 import json
+import math
+import os
 from pprint import pprint
+from collections import deque
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
 import argparse
+import threading
+import queue
 
 try:
     config_file = open("config.json")
@@ -54,6 +69,16 @@ if "label_exclusions" in config_json:
 if "completion_label" in config_json:
     completion_label = config_json["completion_label"]
 
+
+def positive_int(value):
+    """Parse a command line count that must be at least 1"""
+
+    count = int(value)
+    if count < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive number")
+    return count
+
+
 # Parse CLI arguments (these override the config file)
 description = "Utility to migrate issues from GitHub to Jira"
 parser = argparse.ArgumentParser(description=description)
@@ -88,7 +113,46 @@ parser.add_argument(
     action="store_true",
     help="Only run get operations and don't update/create issues",
 )
+parser.add_argument(
+    "-w",
+    "--workers",
+    type=positive_int,
+    default=1,
+    help="Number of issues to migrate in parallel (default: 1)",
+)
+parser.add_argument(
+    "--resume",
+    default=False,
+    action="store_true",
+    help="Skip the steps already recorded in the migration journal",
+)
+source_group = parser.add_mutually_exclusive_group()
+source_group.add_argument(
+    "--sync",
+    default=False,
+    action="store_true",
+    help="Only migrate issues and comments added since the last sync",
+)
+source_group.add_argument(
+    "--extract",
+    metavar="SNAPSHOT",
+    help="Only save the GitHub issues and their comments to a snapshot file, and cache their images",
+)
+source_group.add_argument(
+    "--load",
+    metavar="SNAPSHOT",
+    help="Migrate the issues of a snapshot file instead of listing them on GitHub",
+)
+parser.add_argument(
+    "--plan",
+    default=False,
+    action="store_true",
+    help="Only estimate the requests, bytes and duration of the migration, from GitHub or a --load snapshot",
+)
 args = parser.parse_args()
+if args.plan and (args.sync or args.extract):
+    print("* Error: --plan can only be combined with --load")
+    exit(1)
 
 if args.label_filter:
     label_filter = args.label_filter
@@ -97,75 +161,343 @@ if args.label_exclusions:
 if args.completion_label:
     completion_label = args.completion_label
 
-# Collect GitHub issues using query config or CLI
-label_exclusions = f"{completion_label},{label_exclusions}"
-gh_issues = ghutils.get_issues_by_label(label_filter, label_exclusions)
-print(f"* Recovered {len(gh_issues)} issues to be migrated")
+# HTTP connection pool shared by the GitHub and Jira utils (one connection per worker)
+httputils.configure(
+    max(config_json.get("http_pool_size", httputils.pool_size), args.workers),
+    config_json.get("http_timeout"),
+    config_json.get("rate_limits"),
+    config_json.get("http_retries"),
+)
 
-jira_mappings = []
+# Latency, status, size and retry counters of every request, dumped at the end of the run
+metricsutils.configure(
+    config_json.get("metrics"),
+    config_json.get("metrics_file"),
+    config_json.get("metrics_textfile"),
+)
 
-if len(gh_issues) == 0:
-    print("* No issues were returned from GitHub:")
-    print(f"  Label filter:     {label_filter}")
-    print(f"  Label exclusions: {label_exclusions}")
+cacheutils.configure(
+    config_json.get("image_cache_dir"),
+    config_json.get("image_cache_size"),
+    config_json.get("image_prefetch_workers"),
+)
+migrationutils.configure_labels(
+    config_json.get("type_map"),
+    config_json.get("priority_map"),
+    config_json.get("severity_map"),
+)
+ghutils.writeback_batch_size = int(
+    config_json.get("writeback_batch_size", ghutils.writeback_batch_size)
+)
+ghutils.content_per_minute = int(
+    config_json.get("writeback_comments_per_minute", ghutils.content_per_minute)
+)
+jirautils.bulk_size = min(int(config_json.get("bulk_create_size", 50)), 50)
+jirautils.upload_workers = int(
+    config_json.get("attachment_workers", jirautils.upload_workers)
+)
+jirautils.large_file_size = int(
+    config_json.get("large_attachment_size", jirautils.large_file_size)
+)
+jirautils.large_upload_workers = int(
+    config_json.get("large_attachment_workers", jirautils.large_upload_workers)
+)
+ghutils.ignored_comment_users = set(
+    config_json.get("ignored_comment_users", ghutils.ignored_comment_users)
+)
+ghutils.ignored_comment_bodies = set(
+    config_json.get("ignored_comment_bodies", ghutils.ignored_comment_bodies)
+)
+consolidate_comments = config_json.get("consolidate_comments", False)
+jirautils.comment_max_size = int(
+    config_json.get("comment_max_size", jirautils.comment_max_size)
+)
+transform_processes = int(config_json.get("transform_processes", 0))
+transform_batch_size = int(config_json.get("transform_batch_size", 20))
+
+# Repositories migrated by the run, each to a Jira project (by default the ones of the utils)
+targets = config_json.get("targets") or [
+    {"repo": ghutils.org_repo, "project_key": jirautils.project_key}
+]
+for target in targets:
+    target.setdefault("component", target["repo"].split("/")[1])
+    target["label_id"] = None
+targets_by_repo = {target["repo"].lower(): target for target in targets}
+target_stats = {target["repo"]: {"issues": 0, "migrated": 0} for target in targets}
+ghutils.configure_repo(targets[0]["repo"])
+jirautils.project_key = targets[0]["project_key"]
+if len(targets) > 1 and (args.extract or args.load):
+    print(
+        "* Error: Snapshots hold a single repository, --extract and --load need one target"
+    )
+    exit(1)
+
+
+def get_target(gh_issue_url):
+    """Return the target of a GitHub issue from its URL (https://github.com/org/repo/issues/1)"""
+
+    if len(targets) == 1:
+        return targets[0]
+    return targets_by_repo[
+        "/".join(urlsplit(gh_issue_url).path.split("/")[1:3]).lower()
+    ]
+
+
+def get_journal_id(gh_issue_number, gh_issue_url):
+    """Return the journal key of an issue, its URL when several repositories are migrated"""
+
+    if len(targets) == 1:
+        return gh_issue_number
+    return gh_issue_url
+
+
+def get_issue_source():
+    """Return the function listing GitHub issues of the configured backend"""
+
+    if config_json.get("github_backend") == "graphql":
+        return ghutils.iter_issues_graphql
+    if config_json.get("github_backend") == "search":
+        return ghutils.iter_issues_search
+    return ghutils.iter_issues_by_label
+
+
+def get_image_urls(gh_issue, gh_comments):
+    """Return the image URLs of an issue and its comments"""
+
+    image_urls = jirautils.find_image_urls(gh_issue["body"])
+    for comment in gh_comments:
+        image_urls += jirautils.find_image_urls(comment["body"])
+
+    return image_urls
+
+
+def prefetch_issue_images(gh_issue, gh_comments):
+    """Download the images of an issue and its comments concurrently, return their URLs"""
+
+    image_urls = get_image_urls(gh_issue, gh_comments)
+    cacheutils.prefetch_images(image_urls)
+
+    return image_urls
+
+
+def extract_issue(gh_issue):
+    """Return the snapshot entry of an issue, with its images cached"""
+
+    gh_comments = ghutils.get_issue_comments(gh_issue)
+    prefetch_issue_images(gh_issue, gh_comments)
+
+    return snapshotutils.compact_issue(gh_issue, gh_comments)
+
+
+def iter_in_workers(handle, gh_issues):
+    """Handle issues with the workers, yielding the results in listing order"""
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        pending = deque()
+        for gh_issue in gh_issues:
+            pending.append(executor.submit(handle, gh_issue))
+            if len(pending) >= 2 * args.workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# Extraction only reads GitHub, the snapshot is then migrated with --load
+if args.extract:
+    print(f"* Extracting GitHub issues to {args.extract}")
+    gh_issues = get_issue_source()(
+        label_filter, f"{completion_label},{label_exclusions}"
+    )
+    if not ghutils.repo_id:
+        ghutils.repo_id = str(ghutils.get_repo()["id"])
+    header = {
+        "repo": ghutils.org_repo,
+        "repo_id": ghutils.repo_id,
+        "label_filter": label_filter,
+        "label_exclusions": label_exclusions,
+        "extracted_at": syncutils.get_timestamp(),
+    }
+    issue_count = snapshotutils.write_snapshot(
+        args.extract, iter_in_workers(extract_issue, gh_issues), header
+    )
+    print(f"* Extracted {issue_count} issues")
+    cacheutils.save_index()
+    metricsutils.print_summary()
+    metricsutils.dump()
+    exit(0)
+
+# Resolve the mapped Jira accounts before creating anything
+jirautils.user_cache_path = config_json.get(
+    "user_cache_file", jirautils.user_cache_path
+)
+jirautils.user_cache_ttl = config_json.get("user_cache_ttl", jirautils.user_cache_ttl)
+user_map = migrationutils.validate_user_map(user_map, default_user)
+
+# Issue types, priorities and components used to validate mappings before creating them
+jirautils.meta_cache_path = config_json.get(
+    "meta_cache_file", jirautils.meta_cache_path
+)
+jirautils.meta_cache_ttl = config_json.get("meta_cache_ttl", jirautils.meta_cache_ttl)
+for project_key in dict.fromkeys(target["project_key"] for target in targets):
+    jirautils.get_create_meta(project_key)
+
+# Journal of completed steps, read-only during dry runs, left untouched by plans.
+# Syncs always extend it: it holds the Jira keys and synced comments of earlier runs
+if args.resume or not args.plan:
+    journalutils.open_journal(
+        config_json.get("journal_file"), args.resume or args.dry_run or args.sync
+    )
+
+
+def record_step(issue_number, step, item=None, **data):
+    """Record a completed step in the journal (skipped on dry runs)"""
 
+    if not args.dry_run:
+        journalutils.record(issue_number, step, item, **data)
+
+
+# Issues migrated by a previous run are excluded, unless syncing their new comments
+if not args.sync:
+    label_exclusions = f"{completion_label},{label_exclusions}"
+migration_comment = "This issue has been migrated to Jira"
 
-# ugly hack to be able to upload to jira images downloaded from gh comments.
-jira_comment_image_paths = []
 
-# Iterate over GitHub issues and collect mapping objects
-for gh_issue in gh_issues:
+def build_mapping(gh_issue):
+    """Collect the comments of a GitHub issue and build its Jira mapping object"""
+
     if args.verbose:
         pprint(gh_issue)
     gh_url = gh_issue["html_url"]
+
+    mapped = journalutils.get_step(get_journal_id(gh_issue["number"], gh_url), "mapped")
+    if mapped:
+        attachments = mapped["mapping"]["attachments"]
+        cacheutils.pin_images(attachments)
+        if all(os.path.exists(path) for path in attachments):
+            print(f"* Reusing journaled Jira mapping for {gh_url}")
+            return mapped["mapping"]
+
+        # Images evicted from the cache (or removed by hand) since are downloaded again
+        cacheutils.unpin_images(attachments)
+        print(
+            f"* Journaled Jira mapping for {gh_url} lost cached images, rebuilding it"
+        )
+
     print(f'* Creating Jira mapping for {gh_url} ({gh_issue["title"]})')
 
-    jira_issue_input = migrationutils.issue_map(gh_issue, user_map, default_user)
+    # Download the images of the issue and its comments concurrently before converting them
+    gh_comments = ghutils.get_issue_comments(gh_issue)
+    prefetch_issue_images(gh_issue, gh_comments)
+
+    with metricsutils.timed("transform"):
+        jira_issue_input, jira_comment_input, attachments = (
+            migrationutils.transform_issue(
+                gh_issue, gh_comments, user_map, default_user
+            )
+        )
+
+    return complete_mapping(gh_issue, jira_issue_input, jira_comment_input, attachments)
+
+
+def collect_issue(gh_issue):
+    """Return the input of the transform processes for a GitHub issue.
+
+    The comments are fetched and the images cached and pinned here, so that the
+    transform makes no request.
+    """
+
+    if args.verbose:
+        pprint(gh_issue)
+    print(f'* Creating Jira mapping for {gh_issue["html_url"]} ({gh_issue["title"]})')
 
-    # Collect comments from the GitHub issue
-    # TODO: refacto image management
     gh_comments = ghutils.get_issue_comments(gh_issue)
-    jira_comment_input = []
-    for comment in gh_comments:
-        comment_object, image_paths = migrationutils.comment_map(comment)
-        jira_comment_input.append(comment_object)
-        jira_comment_image_paths += image_paths
+    image_urls = prefetch_issue_images(gh_issue, gh_comments)
+    image_files = {
+        url: cacheutils.get_image(url, pin=True) for url in dict.fromkeys(image_urls)
+    }
+
+    return snapshotutils.compact_issue(gh_issue, gh_comments), image_files
 
-    # Store issue mapping objects
+
+def pack_comments(comment_maps):
+    """Return (comment, number of GitHub comments) tuples, consecutive comments packed when consolidating"""
+
+    if consolidate_comments:
+        return migrationutils.pack_comments(comment_maps, jirautils.comment_max_size)
+    return [(comment_map, 1) for comment_map in comment_maps]
+
+
+def complete_mapping(gh_issue, jira_issue_input, jira_comment_input, attachments):
+    """Return the mapping object of a transformed issue and journal it"""
+
+    gh_url = gh_issue["html_url"]
+
+    # Route the issue to the Jira project and component of its repository
+    target = get_target(gh_url)
+    jira_issue_input["project"] = {"key": target["project_key"]}
+    jira_issue_input["components"] = [{"name": target["component"]}]
+
+    jira_comment_input = [comment for comment, _ in pack_comments(jira_comment_input)]
     mapping_obj = {
         "gh_issue_number": gh_issue["number"],
         "gh_issue_url": gh_url,
+        "gh_issue_node_id": gh_issue.get("node_id"),
         "issue": jira_issue_input,
         "comments": jira_comment_input,
+        "attachments": attachments,
     }
-    jira_mappings.append(mapping_obj)
 
     if args.verbose:
         pprint(mapping_obj)
 
-# Iterate over Jira mappings to create issues with comments
+    record_step(
+        get_journal_id(gh_issue["number"], gh_url), "mapped", mapping=mapping_obj
+    )
+
+    return mapping_obj
+
+
 issue_failures = []
 duplicate_issues = {}
-for jira_map in jira_mappings:
+worker_failures = {}
+worker_failures_lock = threading.Lock()
+
+
+def prepare_issue(jira_map):
+    """Add the backlink to a mapping, return False if it was already migrated"""
 
     gh_issue_url = jira_map["issue"][jirautils.gh_issue_field]
-    gh_issue_title = jira_map["issue"]["summary"]
-    # print(
-    #     '* Checking for issues already linked to GitHub issue ' +
-    #     f'{gh_issue_url} ({gh_issue_title})')
-
-    # custom_field_index = jirautils.gh_issue_field.split('_')[1]
-    # custom_field = f'cf[{custom_field_index}]'
-    # duplicate_list = jirautils.search_issues(
-    #     f'{custom_field} = "{gh_issue_url}"')['issues']
-    # if len(duplicate_list) > 0:
-    #     duplicate_issues[gh_issue_url] = list(
-    #         map(lambda issue: issue['key'], duplicate_list))
-
-    print(f"* Creating Jira issue for {gh_issue_url} ({gh_issue_title})")
-
-    jira_api_url = ""
-    jira_key = ""
+    journal_id = get_journal_id(jira_map["gh_issue_number"], gh_issue_url)
+
+    if journalutils.is_done(journal_id, "labelled"):
+        print(f"* Skipping {gh_issue_url}, already migrated according to the journal")
+        return False
+
+    jira_map["jira_api_url"] = ""
+    jira_map["jira_key"] = ""
+    created = journalutils.get_step(journal_id, "created")
+    if not created and gh_issue_url in gh_issue_index:
+        print(
+            f"* Skipping {gh_issue_url}, already linked to Jira issues {gh_issue_index[gh_issue_url]}"
+        )
+        with worker_failures_lock:
+            duplicate_issues[gh_issue_url] = gh_issue_index[gh_issue_url]
+        journalutils.release(journal_id)
+        return False
+    if created:
+        jira_map["jira_api_url"] = created["jira_api_url"]
+        jira_map["jira_key"] = created["jira_key"]
+        print(f"* Reusing Jira issue {created['jira_key']} created for {gh_issue_url}")
+
+    if not created:
+        errors = jirautils.validate_issue(jira_map["issue"])
+        if errors:
+            print(
+                f"* Error: Invalid Jira issue for {gh_issue_url}: {', '.join(errors)}"
+            )
+            record_failure(gh_issue_url)
+            return False
+
     backlink = (
         f"\n\n---\nℹ️  This issue was migrated from GitHub issue {gh_issue_url}\n---"
     )
@@ -175,28 +507,79 @@ for jira_map in jira_mappings:
         print("jira_map just before issue creation: ")
         pprint(jira_map)
 
-    if not args.dry_run:
-        create_response = jirautils.create_issue(jira_map["issue"])
+    return True
+
+
+def create_issues(jira_maps):
+    """Create the Jira issues of a batch of mappings with a single bulk request"""
 
+    for jira_map in jira_maps:
+        print(
+            f"* Creating Jira issue for {jira_map['gh_issue_url']} ({jira_map['issue']['summary']})"
+        )
+
+    create_responses = jirautils.create_issues(
+        [jira_map["issue"] for jira_map in jira_maps]
+    )
+
+    for jira_map, create_response in zip(jira_maps, create_responses):
         if args.verbose:
             pprint(create_response)
-        if "self" in create_response:
-            jira_api_url = create_response["self"]
-        if "key" in create_response:
-            jira_key = create_response["key"]
+        if "key" not in create_response:
+            print(
+                f"* Error: Jira issue for {jira_map['gh_issue_url']} was not created: {create_response['errors']}"
+            )
+            record_failure(jira_map["gh_issue_url"])
+            continue
+
+        jira_map["jira_api_url"] = create_response["self"]
+        jira_map["jira_key"] = create_response["key"]
+        record_step(
+            get_journal_id(jira_map["gh_issue_number"], jira_map["gh_issue_url"]),
+            "created",
+            jira_key=jira_map["jira_key"],
+            jira_api_url=jira_map["jira_api_url"],
+        )
+        finish_queue.put(jira_map)
+
+
+def finish_issue(jira_map):
+    """Copy the comments and attachments of a created Jira issue, then update GitHub"""
+
+    gh_issue_number = jira_map["gh_issue_number"]
+    journal_id = get_journal_id(gh_issue_number, jira_map["gh_issue_url"])
+    jira_api_url = jira_map["jira_api_url"]
+    jira_key = jira_map["jira_key"]
 
     if not args.dry_run and jira_key == "":
         print("* Error: A Jira key was not returned in the creation response")
-        issue_failures.append(gh_issue_url)
-        continue
+        return False
 
     print(f"  * Adding comments from GitHub to new Jira issue {jira_key}")
     if not args.dry_run:
-        if jira_comment_image_paths:
+        if jira_map["attachments"]:
             print("📎 Uploading attachments...")
-            for image_path in jira_comment_image_paths:
-                jirautils.upload_image_to_jira(jira_key, image_path)
-        for comment_map in jira_map["comments"]:
+            filenames = jirautils.upload_attachments(
+                jira_key,
+                jira_map["attachments"],
+                skip=lambda content_hash: journalutils.is_done(
+                    journal_id, "attachment", content_hash
+                ),
+                on_upload=lambda content_hash, filename: record_step(
+                    journal_id, "attachment", content_hash, filename=filename
+                ),
+            )
+            if None in filenames:
+                # Left unlabelled so --resume uploads the missing files
+                print(
+                    f"* Error: {filenames.count(None)} attachments were not added to {jira_key}"
+                )
+                cacheutils.unpin_images(jira_map["attachments"])
+                return False
+        # Comments are posted sequentially to keep their order in Jira
+        for comment_index, comment_map in enumerate(jira_map["comments"]):
+            if journalutils.is_done(journal_id, "comment", comment_index):
+                continue
             if args.verbose:
                 print(comment_map)
             comment_response = jirautils.add_comment_from_url(
@@ -204,6 +587,12 @@ for jira_map in jira_mappings:
             )
             if args.verbose:
                 pprint(comment_response)
+            if "id" not in comment_response:
+                # Left unlabelled so --resume posts the rest, in order
+                print(f"* Error: Comment {comment_index} was not added to {jira_key}")
+                cacheutils.unpin_images(jira_map["attachments"])
+                return False
+            record_step(journal_id, "comment", comment_index)
 
     # if not args.dry_run:
     #     if jira_map['issue']['status']:
@@ -212,23 +601,661 @@ for jira_map in jira_mappings:
     #         if args.verbose:
     #             pprint(transition_response)
 
-    # Add comment in GH issue with link to new Jira issue
-    gh_issue_number = jira_map["gh_issue_number"]
+    cacheutils.unpin_images(jira_map["attachments"])
+
+    # Queue the comment with a link to the new Jira issue and the migration label
     jira_html_url = f"{jirautils.html_url}/{jira_key}"
-    gh_comment = f"This issue has been migrated to Jira: {jira_html_url}"
+    gh_comment = f"{migration_comment}: {jira_html_url}"
+    if journalutils.is_done(journal_id, "backlinked"):
+        gh_comment = None
 
+    print("  * Queuing migration comment and label for the gh issue")
     if not args.dry_run:
-        comment_response = ghutils.add_issue_comment(gh_issue_number, gh_comment)
-        print("  * Migration comment added to the gh issue")
-        if args.verbose:
-            pprint(comment_response)
+        writeback_queue.put(
+            {
+                "gh_issue_number": gh_issue_number,
+                "gh_issue_url": jira_map["gh_issue_url"],
+                "gh_issue_node_id": jira_map.get("gh_issue_node_id"),
+                "comment": gh_comment,
+                "label_id": get_target(jira_map["gh_issue_url"])["label_id"],
+            }
+        )
 
-    # Add migration label if allowed
-    print("  * Handling GitHub issue labels and closing issue if allowed")
-    if not args.dry_run:
-        label_response = ghutils.add_issue_label(gh_issue_number, completion_label)
+    return True
+
+
+def record_failure(gh_issue_url):
+    """Record a failed migration against the current worker"""
+
+    worker_name = threading.current_thread().name
+    with worker_failures_lock:
+        worker_failures.setdefault(worker_name, []).append(gh_issue_url)
+
+    # Failed issues are resumed from the journal file by the next run
+    gh_issue_number = int(gh_issue_url.rstrip("/").rsplit("/", 1)[1])
+    journalutils.release(get_journal_id(gh_issue_number, gh_issue_url))
+
+
+def record_migrated(gh_issue_url):
+    """Count a migrated issue against its repository"""
+
+    with worker_failures_lock:
+        target_stats[get_target(gh_issue_url)["repo"]]["migrated"] += 1
+
+
+def sync_comments(gh_issue):
+    """Append the comments posted since the last sync to an already migrated issue"""
+
+    gh_issue_url = gh_issue["html_url"]
+    journal_id = get_journal_id(gh_issue["number"], gh_issue_url)
+
+    created = journalutils.get_step(journal_id, "created")
+    if created:
+        jira_key = created["jira_key"]
+    elif gh_issue_url in gh_issue_index:
+        jira_key = gh_issue_index[gh_issue_url][-1]
+    else:
+        print(f"* Error: No Jira issue found for migrated issue {gh_issue_url}")
+        return False
+
+    gh_comments = [
+        comment
+        for comment in ghutils.get_issue_comments(
+            gh_issue, since=sync_state["last_sync"]
+        )
+        if not comment["body"].startswith(migration_comment)
+        and not journalutils.is_done(journal_id, "synced_comment", comment["id"])
+    ]
+    if not gh_comments:
+        return True
+
+    print(f"* Adding {len(gh_comments)} new comments of {gh_issue_url} to {jira_key}")
+    comment_maps = []
+    comment_image_paths = []
+    for comment in gh_comments:
+        comment_map, image_paths = migrationutils.comment_map(comment)
+        comment_maps.append(comment_map)
+        comment_image_paths.append(image_paths)
+
+    try:
+        start = 0
+        for comment_map, count in pack_comments(comment_maps):
+            packed_comments = gh_comments[start : start + count]
+            image_paths = sum(comment_image_paths[start : start + count], [])
+            start += count
+            if args.verbose:
+                print(comment_map)
+            if image_paths and not args.dry_run:
+                if None in jirautils.upload_attachments(jira_key, image_paths):
+                    return False
+            if args.dry_run:
+                continue
+
+            comment_response = jirautils.add_comment(jira_key, comment_map)
+            if args.verbose:
+                pprint(comment_response)
+            if "id" not in comment_response:
+                return False
+            for comment in packed_comments:
+                record_step(journal_id, "synced_comment", comment["id"])
+    finally:
+        for image_paths in comment_image_paths:
+            cacheutils.unpin_images(image_paths)
+
+    return True
+
+
+def map_issue_worker(gh_issue):
+    """Map a GitHub issue and send it to the creation or finishing stage"""
+
+    gh_issue_url = gh_issue["html_url"]
+    try:
+        if args.sync and ghutils.has_label(gh_issue, completion_label):
+            # Comments of the first sync were copied by the migration itself
+            if sync_state["last_sync"] and not sync_comments(gh_issue):
+                record_failure(gh_issue_url)
+            return
+
+        # New mappings are built by the transform processes when enabled
+        if transform_pool and not journalutils.is_done(
+            get_journal_id(gh_issue["number"], gh_issue_url), "mapped"
+        ):
+            transform_queue.put(collect_issue(gh_issue))
+            return
+
+        jira_map = build_mapping(gh_issue)
+    except (Exception, SystemExit) as error:
+        print(f"* Error: Migration of {gh_issue_url} failed: {error!r}")
+        record_failure(gh_issue_url)
+        return
+
+    queue_mapping(jira_map)
+
+
+def queue_mapping(jira_map):
+    """Send a mapping to the creation or finishing stage, unless it was already migrated"""
+
+    try:
+        if not prepare_issue(jira_map):
+            cacheutils.unpin_images(jira_map["attachments"])
+            return
+    except (Exception, SystemExit) as error:
+        print(f"* Error: Migration of {jira_map['gh_issue_url']} failed: {error!r}")
+        record_failure(jira_map["gh_issue_url"])
+        return
+
+    if args.dry_run or jira_map["jira_key"]:
+        finish_queue.put(jira_map)
+    else:
+        create_queue.put(jira_map)
+
+
+def queue_transformed(items, future):
+    """Queue the mappings of a batch once the transform processes returned it"""
+
+    try:
+        results = future.result()
+    except Exception as error:
+        print(f"* Error: Transform of {len(items)} GitHub issues failed: {error!r}")
+        for gh_issue, image_files in items:
+            cacheutils.unpin_images([path for path in image_files.values() if path])
+            record_failure(gh_issue["html_url"])
+        return
+
+    for (gh_issue, image_files), (result, seconds, cpu_seconds) in zip(items, results):
+        metricsutils.record_duration("transform", seconds, cpu_seconds)
+        jira_issue_input, jira_comment_input, attachments = result
+        # Pin the attachments as the in-thread conversion does, then drop the collection pins
+        cacheutils.pin_images(attachments)
+        cacheutils.unpin_images([path for path in image_files.values() if path])
+        queue_mapping(
+            complete_mapping(
+                gh_issue, jira_issue_input, jira_comment_input, attachments
+            )
+        )
+
+
+def transform_worker(stage_queue):
+    """Send batches of collected issues to the transform processes, keeping their order"""
+
+    pending = deque()
+
+    def submit(items):
+        pending.append(
+            (items, transform_pool.submit(migrationutils.transform_batch, items))
+        )
+        # Keep every process busy without buffering the whole backlog
+        while len(pending) > transform_processes:
+            queue_transformed(*pending.popleft())
+
+    consume_batches(stage_queue, transform_batch_size, submit)
+    while pending:
+        queue_transformed(*pending.popleft())
+
+
+def finish_issue_worker(jira_map):
+    """Run finish_issue and record failures against the current worker"""
+
+    gh_issue_url = jira_map["gh_issue_url"]
+    try:
+        migrated = finish_issue(jira_map)
+    except (Exception, SystemExit) as error:
+        print(f"* Error: Migration of {gh_issue_url} failed: {error!r}")
+        migrated = False
+
+    if not migrated:
+        record_failure(gh_issue_url)
+    elif args.dry_run:
+        record_migrated(gh_issue_url)
+
+
+def consume(stage_queue, handle):
+    """Handle the items of a queue until the end marker is received"""
+
+    while True:
+        item = stage_queue.get()
+        if item is None:
+            break
+        handle(item)
+
+
+def create_issues_worker(jira_maps):
+    """Run create_issues and record failures of the whole batch against the current worker"""
+
+    try:
+        create_issues(jira_maps)
+    except (Exception, SystemExit) as error:
+        print(
+            f"* Error: Bulk creation of {len(jira_maps)} Jira issues failed: {error!r}"
+        )
+        for jira_map in jira_maps:
+            record_failure(jira_map["gh_issue_url"])
+
+
+def write_back(writebacks):
+    """Add the migration comments and labels of a batch of issues to GitHub"""
+
+    # Mappings journaled before node IDs were collected go through the REST API
+    rest_writebacks = [item for item in writebacks if not item["gh_issue_node_id"]]
+    graphql_writebacks = [item for item in writebacks if item["gh_issue_node_id"]]
+
+    # The completion label has its own node ID in each repository
+    graphql_writebacks.sort(key=lambda item: item["label_id"])
+    results = []
+    for label_id in dict.fromkeys(item["label_id"] for item in graphql_writebacks):
+        results += ghutils.write_back(
+            [
+                (item["gh_issue_node_id"], item["comment"], True)
+                for item in graphql_writebacks
+                if item["label_id"] == label_id
+            ],
+            label_id,
+        )
+    for item in rest_writebacks:
+        issue_repo = get_target(item["gh_issue_url"])["repo"]
+        commented = True
+        if item["comment"] is not None:
+            comment_response = ghutils.add_issue_comment(
+                item["gh_issue_number"], item["comment"], issue_repo
+            )
+            if args.verbose:
+                pprint(comment_response)
+            commented = "id" in comment_response
+        label_response = ghutils.add_issue_label(
+            item["gh_issue_number"], completion_label, issue_repo
+        )
         if args.verbose:
             pprint(label_response)
+        results.append((commented, isinstance(label_response, list)))
+
+    for item, (commented, labelled) in zip(
+        graphql_writebacks + rest_writebacks, results
+    ):
+        journal_id = get_journal_id(item["gh_issue_number"], item["gh_issue_url"])
+        if item["comment"] is not None and commented:
+            record_step(journal_id, "backlinked")
+        if commented and labelled:
+            record_step(journal_id, "labelled")
+            record_migrated(item["gh_issue_url"])
+            print(f"  * Migration comment and label added to {item['gh_issue_url']}")
+        else:
+            print(f"* Error: Write-back to {item['gh_issue_url']} failed")
+            record_failure(item["gh_issue_url"])
+        journalutils.release(journal_id)
+
+
+def write_back_worker(writebacks):
+    """Run write_back and record failures of the whole batch against the current worker"""
+
+    try:
+        write_back(writebacks)
+    except (Exception, SystemExit) as error:
+        print(
+            f"* Error: Write-back of {len(writebacks)} GitHub issues failed: {error!r}"
+        )
+        for item in writebacks:
+            record_failure(item["gh_issue_url"])
+
+
+def consume_batches(stage_queue, batch_size, handle):
+    """Handle the items of a queue by batches, sent when full or when the queue idles"""
+
+    batch = []
+    finished = False
+    while not finished:
+        try:
+            item = stage_queue.get(timeout=batch_wait)
+        except queue.Empty:
+            item = {}
+
+        if item is None:
+            finished = True
+        elif item:
+            batch.append(item)
+            if len(batch) < batch_size:
+                continue
+
+        if batch:
+            handle(batch)
+            batch = []
+
+
+def start_workers(name, count, target, *target_args):
+    """Start count threads running target"""
+
+    threads = [
+        threading.Thread(target=target, args=target_args, name=f"{name}_{index}")
+        for index in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+
+    return threads
+
+
+def stop_workers(stage_queue, threads):
+    """Send an end marker to each thread of a stage and wait for them"""
+
+    for thread in threads:
+        stage_queue.put(None)
+    for thread in threads:
+        thread.join()
+
+
+# Index the Jira issues already linked to a GitHub issue to skip duplicates
+print("* Indexing Jira issues already linked to GitHub issues")
+gh_issue_index = {}
+for project_key in dict.fromkeys(target["project_key"] for target in targets):
+    gh_issue_index.update(jirautils.get_gh_issue_index(project_key))
+print(f"* Found {len(gh_issue_index)} GitHub issues already linked in Jira")
+
+# Collect GitHub issues using query config or CLI
+if args.sync:
+    # Syncs rely on the REST API for since and ETags
+    sync_state = syncutils.load_state(config_json.get("sync_state_file"))
+    sync_started = syncutils.get_timestamp()
+    print(f"* Syncing issues updated since {sync_state['last_sync'] or 'ever'}")
+    iter_issues = lambda labels, exclusions: ghutils.iter_issues_by_label(
+        labels, exclusions, since=sync_state["last_sync"], etags=sync_state["etags"]
+    )
+elif args.load:
+    snapshot_header = snapshotutils.read_header(args.load)
+    print(
+        f"* Loading issues of {snapshot_header['repo']} extracted at {snapshot_header['extracted_at']} from {args.load}"
+    )
+    if snapshot_header["repo"] != ghutils.org_repo:
+        print(f"* Warning: The snapshot was not extracted from {ghutils.org_repo}")
+    ghutils.repo_id = snapshot_header["repo_id"]
+    iter_issues = lambda labels, exclusions: snapshotutils.iter_snapshot(
+        args.load, exclusions
+    )
+else:
+    iter_issues = get_issue_source()
+
+
+planned_downloads = set()
+planned_downloads_lock = threading.Lock()
+
+
+def plan_issue(gh_issue):
+    """Return the requests and bytes the migration of an issue will take, or None if it is done.
+
+    Nothing is written or downloaded: uncached images count as downloads and as uploads
+    of unknown size.
+    """
+
+    gh_issue_url = gh_issue["html_url"]
+    journal_id = get_journal_id(gh_issue["number"], gh_issue_url)
+    if journalutils.is_done(journal_id, "labelled"):
+        return None
+    created = journalutils.get_step(journal_id, "created")
+    if not created and gh_issue_url in gh_issue_index:
+        return {"url": gh_issue_url, "duplicate": 1}
+
+    download_hosts = {}
+    mapped = journalutils.get_step(journal_id, "mapped")
+    if mapped:
+        comments = mapped["mapping"]["comments"]
+        attachments = mapped["mapping"]["attachments"]
+    else:
+        gh_comments = ghutils.get_issue_comments(gh_issue)
+        image_files = {}
+        for image_url in dict.fromkeys(get_image_urls(gh_issue, gh_comments)):
+            image_files[image_url] = cacheutils.get_cached_image(image_url)
+            if image_files[image_url] is None:
+                with planned_downloads_lock:
+                    downloaded = image_url in planned_downloads
+                    planned_downloads.add(image_url)
+                if not downloaded:
+                    host = urlsplit(image_url).netloc
+                    download_hosts[host] = download_hosts.get(host, 0) + 1
+                url_hash = hashlib.sha256(image_url.encode()).hexdigest()
+                image_files[image_url] = os.path.join(
+                    cacheutils.cache_dir, f"{url_hash}.png"
+                )
+        _, jira_comments, attachments = migrationutils.transform_issue(
+            gh_issue, gh_comments, user_map, default_user, image_files
+        )
+        comments = [comment for comment, _ in pack_comments(jira_comments)]
+
+    uploads = {}
+    unknown_sizes = 0
+    for filepath in dict.fromkeys(attachments):
+        if not os.path.exists(filepath):
+            uploads[filepath] = 0
+            unknown_sizes += 1
+            continue
+        content_hash = cacheutils.get_file_hash(filepath)
+        if not journalutils.is_done(journal_id, "attachment", content_hash):
+            uploads[content_hash] = os.path.getsize(filepath)
+
+    return {
+        "url": gh_issue_url,
+        "create": 0 if created else 1,
+        "comments": sum(
+            1
+            for index in range(len(comments))
+            if not journalutils.is_done(journal_id, "comment", index)
+        ),
+        "uploads": len(uploads),
+        "upload_bytes": sum(uploads.values()),
+        "unknown_sizes": unknown_sizes,
+        "downloads": sum(download_hosts.values()),
+        "download_hosts": download_hosts,
+        "writeback": 1,
+        "backlink": 0 if journalutils.is_done(journal_id, "backlinked") else 1,
+    }
+
+
+def print_plan(costs):
+    """Print the requests and projected duration of the planned migration"""
+
+    totals = planutils.get_totals(costs)
+    github_host = urlsplit(ghutils.root_url).netloc
+    jira_host = urlsplit(jirautils.root_url).netloc
+
+    # Latencies and upload throughput observed by the previous run, else by the plan reads
+    plan_metrics = metricsutils.get_metrics()
+    run_metrics = planutils.load_metrics(metricsutils.metrics_path) or plan_metrics
+    latencies = planutils.get_host_latencies(run_metrics)
+    upload_rate = planutils.get_upload_rate(run_metrics)
+    upload_seconds = 0
+    if upload_rate:
+        upload_seconds = planutils.get_upload_bytes(totals) / upload_rate
+
+    # The reads made by the plan are made again by the migration
+    requests = {
+        github_host: planutils.get_host_requests(plan_metrics, github_host)
+        + len(targets)
+        + math.ceil(totals.get("writeback", 0) / ghutils.writeback_batch_size),
+        jira_host: planutils.get_host_requests(plan_metrics, jira_host)
+        + math.ceil(totals.get("create", 0) / jirautils.bulk_size)
+        + totals.get("comments", 0)
+        + totals.get("uploads", 0),
+    }
+    for cost in costs:
+        for host, count in cost.get("download_hosts", {}).items():
+            requests[host] = requests.get(host, 0) + count
+
+    hosts = {}
+    for host, count in requests.items():
+        rate = httputils.get_budget(f"https://{host}/").state()["rate"]
+        hosts[host] = {
+            "requests": count,
+            "rate": rate,
+            "duration": planutils.get_host_duration(
+                count,
+                rate,
+                latencies.get(host, 0),
+                args.workers,
+                upload_seconds if host == jira_host else 0,
+            ),
+        }
+    writeback_seconds = totals.get("backlink", 0) * 60 / ghutils.content_per_minute
+
+    jira_rate = hosts[jira_host]["rate"]
+    issue_costs = [cost for cost in costs if "create" in cost]
+    issue_seconds = [
+        planutils.get_issue_seconds(
+            cost,
+            jira_rate,
+            min(
+                [hosts[host]["rate"] for host in cost["download_hosts"]],
+                default=jira_rate,
+            ),
+            upload_rate,
+        )
+        for cost in issue_costs
+    ]
+    planutils.print_plan(totals, hosts, writeback_seconds, issue_costs, issue_seconds)
+
+
+# Plans only read GitHub (or the snapshot), the image cache and the journal
+if args.plan:
+    costs = []
+    skipped = 0
+    for target in targets:
+        if ghutils.org_repo != target["repo"]:
+            ghutils.configure_repo(target["repo"])
+        print(f"* Planning the migration of {target['repo']}")
+        for cost in iter_in_workers(
+            plan_issue, iter_issues(label_filter, label_exclusions)
+        ):
+            if cost is None:
+                skipped += 1
+            else:
+                costs.append(cost)
+    print(
+        f"* Planned {len(costs)} issues, {skipped} already migrated according to the journal"
+    )
+    print_plan(costs)
+    exit(0)
+
+# Processes converting mappings on every core, forked before any thread is started
+transform_pool = None
+if transform_processes > 0:
+    transform_pool = migrationutils.start_transform_pool(
+        transform_processes, user_map, default_user
+    )
+    if transform_pool:
+        print(f"* Transforming issues with {transform_processes} processes")
+    else:
+        print(
+            "* Warning: Transform processes need the fork start method, mapping in threads"
+        )
+
+# Stream GitHub issues page by page through bounded queues: mapping workers (with
+# an optional thread batching their issues to the transform processes), a single
+# bulk creation thread, finishing workers (comments, attachments), then a single
+# thread writing back comments and labels to GitHub in batches
+batch_wait = 1
+issue_queue = queue.Queue(maxsize=2 * args.workers)
+transform_queue = queue.Queue(maxsize=2 * transform_batch_size)
+create_queue = queue.Queue(maxsize=2 * jirautils.bulk_size)
+finish_queue = queue.Queue(maxsize=2 * args.workers)
+mappers = start_workers("mapper", args.workers, consume, issue_queue, map_issue_worker)
+transformers = []
+if transform_pool:
+    transformers = start_workers("transformer", 1, transform_worker, transform_queue)
+writeback_queue = queue.Queue(maxsize=2 * ghutils.writeback_batch_size)
+creators = start_workers(
+    "creator",
+    1,
+    consume_batches,
+    create_queue,
+    jirautils.bulk_size,
+    create_issues_worker,
+)
+finishers = start_workers(
+    "worker", args.workers, consume, finish_queue, finish_issue_worker
+)
+writers = start_workers(
+    "writer",
+    1,
+    consume_batches,
+    writeback_queue,
+    ghutils.writeback_batch_size,
+    write_back_worker,
+)
+
+if args.workers > 1:
+    print(f"* Migrating issues with {args.workers} workers")
+
+issue_count = 0
+try:
+    # Repositories are listed one after the other into the shared pipeline, so the
+    # workers start on the next repository while the last issues of one are finished
+    for target in targets:
+        if ghutils.org_repo != target["repo"]:
+            ghutils.configure_repo(target["repo"])
+        if len(targets) > 1:
+            print(
+                f"* Listing issues of {target['repo']} for Jira project {target['project_key']}"
+            )
+
+        # Node ID of the completion label, added to migrated issues by GraphQL mutations
+        if not args.dry_run:
+            target["label_id"] = ghutils.get_label_id(completion_label)
+
+        for gh_issue in iter_issues(label_filter, label_exclusions):
+            issue_queue.put(gh_issue)
+            target_stats[target["repo"]]["issues"] += 1
+            issue_count += 1
+finally:
+    stop_workers(issue_queue, mappers)
+    stop_workers(transform_queue, transformers)
+    stop_workers(create_queue, creators)
+    stop_workers(finish_queue, finishers)
+    stop_workers(writeback_queue, writers)
+    cacheutils.save_index()
+
+if transform_pool:
+    transform_pool.shutdown()
+
+print(f"* Recovered {issue_count} issues to be migrated")
+
+if issue_count == 0:
+    print("* No issues were returned from GitHub:")
+    print(f"  Label filter:     {label_filter}")
+    print(f"  Label exclusions: {label_exclusions}")
+
+for worker_name in sorted(worker_failures):
+    failures = worker_failures[worker_name]
+    if args.verbose:
+        print(f"* {worker_name}: {len(failures)} failed migrations")
+    issue_failures.extend(failures)
+
+if len(targets) > 1:
+    print("* Summary per repository:")
+    for target in targets:
+        repo_stats = target_stats[target["repo"]]
+        failed = sum(1 for url in set(issue_failures) if get_target(url) is target)
+        duplicates = sum(1 for url in duplicate_issues if get_target(url) is target)
+        print(
+            f"  {target['repo']} -> {target['project_key']}: {repo_stats['issues']} issues, "
+            f"{repo_stats['migrated']} migrated, {failed} failed, {duplicates} duplicates"
+        )
+
+# A failed issue must be picked up again by the next sync
+if args.sync and not args.dry_run:
+    if issue_failures:
+        print("* Sync state not saved because of failed migrations")
+    else:
+        sync_state["last_sync"] = sync_started
+        syncutils.save_state(sync_state)
+
+stats = jirautils.attachment_stats
+print(
+    f"* Attachments: {stats['uploaded']} uploaded ({stats['bytes']} bytes), "
+    f"{stats['duplicates']} duplicates skipped, {stats['failed']} failed"
+)
+
+if args.verbose:
+    for host, state in httputils.get_budget_states().items():
+        print(f"* Rate limit budget for {host}: {state}")
+
+metricsutils.print_summary()
+metricsutils.dump()
 
 if len(issue_failures) > 0:
     print("* Failed to create Jira issues for:")
@@ -0,0 +1,266 @@
+import utils.ghutils as ghutils
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+# Content-addressed image cache: files are named after the SHA-256 of their content
+# and index.json maps each downloaded URL to its file
+cache_dir = "images"
+max_size = 500 * 1024 * 1024
+prefetch_workers = 8
+# Downloads between two writes of index.json, which is also written at the end of a run
+save_interval = 100
+# Eviction frees the cache down to this share of max_size, so it does not run on every download
+evict_ratio = 0.9
+
+extensions = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/svg+xml": ".svg",
+    "image/avif": ".avif",
+}
+
+index = None
+index_lock = threading.Lock()
+url_locks = {}
+# Size of each indexed file and their running total, so eviction never stats the cache
+file_sizes = {}
+total_size = 0
+unsaved = 0
+# Serializes moving files in and out of the cache, and writing the index
+files_lock = threading.Lock()
+save_lock = threading.Lock()
+# Files of mapped issues waiting for their upload, never evicted
+pins = {}
+
+
+def configure(new_cache_dir=None, new_max_size=None, new_prefetch_workers=None):
+    """Set cache location, size bound and prefetch concurrency (before the first download)"""
+
+    global cache_dir, max_size, prefetch_workers, index
+
+    if new_cache_dir:
+        cache_dir = new_cache_dir
+    if new_max_size:
+        max_size = int(new_max_size)
+    if new_prefetch_workers:
+        prefetch_workers = int(new_prefetch_workers)
+
+    with index_lock:
+        index = None
+        file_sizes.clear()
+
+
+def get_file_hash(filepath):
+    """Return the SHA-256 digest of a file's content"""
+
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for chunk in iter(lambda: file.read(65536), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def load_index():
+    """Return the URL index, reading it from disk on first use (index_lock must be held)"""
+
+    global index, total_size
+
+    if index is None:
+        index = {}
+        try:
+            with open(os.path.join(cache_dir, "index.json")) as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            pass
+
+        # Drop entries whose file was removed by hand
+        for url in list(index):
+            if not os.path.exists(index[url]["path"]):
+                del index[url]
+
+        file_sizes.clear()
+        for entry in index.values():
+            file_sizes[entry["path"]] = entry["size"]
+        total_size = sum(file_sizes.values())
+
+    return index
+
+
+def save_index():
+    """Atomically write the URL index to disk if it changed since the last write"""
+
+    global unsaved
+
+    with index_lock:
+        if index is None or not unsaved:
+            return
+        # Entries are copied as their last use time keeps changing
+        snapshot = {url: dict(entry) for url, entry in index.items()}
+        unsaved = 0
+
+    with save_lock:
+        os.makedirs(cache_dir, exist_ok=True)
+        index_path = os.path.join(cache_dir, "index.json")
+        with open(index_path + ".tmp", "w") as index_file:
+            json.dump(snapshot, index_file, indent=2)
+        os.replace(index_path + ".tmp", index_path)
+
+
+def add_entry(image_url, entry):
+    """Index a downloaded file, return whether the index is due to be written (index_lock must be held)"""
+
+    global total_size, unsaved
+
+    load_index()[image_url] = entry
+    if entry["path"] not in file_sizes:
+        file_sizes[entry["path"]] = entry["size"]
+        total_size += entry["size"]
+    unsaved += 1
+
+    return unsaved >= save_interval
+
+
+def evict(keep_path):
+    """Drop the least recently used files from the index once the cache exceeds max_size.
+
+    Returns the paths of the dropped files for the caller to remove (index_lock must be held).
+    """
+
+    global total_size
+
+    if total_size <= max_size:
+        return []
+
+    last_used = {}
+    for entry in index.values():
+        last_used[entry["path"]] = max(last_used.get(entry["path"], 0), entry["used"])
+
+    evicted = set()
+    for path in sorted(last_used, key=last_used.get):
+        if total_size <= max_size * evict_ratio:
+            break
+        if path == keep_path or path in pins:
+            continue
+        total_size -= file_sizes.pop(path)
+        evicted.add(path)
+
+    for url in [url for url, entry in index.items() if entry["path"] in evicted]:
+        del index[url]
+
+    return list(evicted)
+
+
+def pin_images(filepaths):
+    """Keep files out of eviction until they are unpinned"""
+
+    with index_lock:
+        for filepath in filepaths:
+            pins[filepath] = pins.get(filepath, 0) + 1
+
+
+def unpin_images(filepaths):
+    """Allow pinned files to be evicted again"""
+
+    with index_lock:
+        for filepath in filepaths:
+            if pins.get(filepath, 0) > 1:
+                pins[filepath] -= 1
+            else:
+                pins.pop(filepath, None)
+
+
+def get_cached_image(image_url, pin=False):
+    """Return the cached file for an image URL, or None"""
+
+    with index_lock:
+        entry = load_index().get(image_url)
+        if entry is None:
+            return None
+        entry["used"] = time.time()
+        if pin:
+            pins[entry["path"]] = pins.get(entry["path"], 0) + 1
+        return entry["path"]
+
+
+def get_image(image_url, pin=False):
+    """Return the local file of an image, downloading it on a cache miss.
+
+    With pin, the file is kept out of eviction until unpin_images is called.
+    """
+
+    filepath = get_cached_image(image_url, pin)
+    if filepath:
+        return filepath
+
+    with index_lock:
+        url_lock = url_locks.setdefault(image_url, threading.Lock())
+
+    # Only one thread downloads a given URL, the others wait for the cache
+    with url_lock:
+        filepath = get_cached_image(image_url, pin)
+        if filepath:
+            return filepath
+
+        os.makedirs(cache_dir, exist_ok=True)
+        file_descriptor, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".part")
+        try:
+            with os.fdopen(file_descriptor, "wb") as file:
+                content_type = ghutils.download_image_with_cookie(image_url, file)
+
+            if content_type is None:
+                return None
+
+            content_hash = get_file_hash(tmp_path)
+            extension = extensions.get(content_type.split(";")[0].strip(), ".png")
+            filepath = os.path.join(cache_dir, content_hash + extension)
+            size = os.path.getsize(tmp_path)
+
+            # Evicted files are removed before another download can bring them back
+            with files_lock:
+                os.replace(tmp_path, filepath)
+                with index_lock:
+                    save_due = add_entry(
+                        image_url,
+                        {
+                            "hash": content_hash,
+                            "path": filepath,
+                            "size": size,
+                            "used": time.time(),
+                        },
+                    )
+                    if pin:
+                        pins[filepath] = pins.get(filepath, 0) + 1
+                    evicted = evict(filepath)
+                for path in evicted:
+                    os.remove(path)
+        finally:
+            # Partial files are not indexed, so eviction would never remove them
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        if save_due:
+            save_index()
+
+        return filepath
+
+
+def prefetch_images(image_urls):
+    """Download the images missing from the cache concurrently"""
+
+    missing = [url for url in dict.fromkeys(image_urls) if not get_cached_image(url)]
+    if not missing:
+        return
+
+    with ThreadPoolExecutor(
+        max_workers=prefetch_workers, thread_name_prefix="prefetch"
+    ) as executor:
+        list(executor.map(get_image, missing))
@@ -1,39 +1,146 @@
 import migrationauth
-import requests
-import os
+import utils.httputils as httputils
+import math
+import functools
+import threading
+import time
 
 
 repo = "backend"
 org_repo = "waldoapp/" + repo
 root_url = "https://api.github.com/repos"
 base_url = f"{root_url}/{org_repo}/issues"
+graphql_url = "https://api.github.com/graphql"
+search_url = "https://api.github.com/search/issues"
+repo_id = ""
+
+# Comments from these users or with exactly these bodies (bots) are not migrated
+ignored_comment_users = {"stale[bot]"}
+ignored_comment_bodies = {"dependency_scan failed."}
+
+# GitHub's secondary rate limit allows about 80 content-creating requests per minute,
+# write-backs keep a margin below it
+writeback_batch_size = 10
+content_per_minute = 60
+next_writeback = 0
+writeback_lock = threading.Lock()
+
+issue_fields = """
+    id
+    number
+    title
+    body
+    url
+    author { __typename login }
+    labels(first: 100) { nodes { name } }
+    assignees(first: 100) { nodes { __typename login } }
+    comments(first: 100) {
+        pageInfo { hasNextPage endCursor }
+        nodes { author { __typename login } body createdAt }
+    }
+"""
+
+issues_query = """
+query($owner: String!, $name: String!, $labels: [String!], $pagination: Int!, $cursor: String) {
+    repository(owner: $owner, name: $name) {
+        databaseId
+        issues(first: $pagination, after: $cursor, labels: $labels, states: OPEN) {
+            pageInfo { hasNextPage endCursor }
+            nodes { %s }
+        }
+    }
+}
+""" % issue_fields
+
+label_query = """
+query($owner: String!, $name: String!, $label: String!) {
+    repository(owner: $owner, name: $name) {
+        label(name: $label) { id }
+    }
+}
+"""
+
+comments_query = """
+query($id: ID!, $cursor: String) {
+    node(id: $id) {
+        ... on Issue {
+            comments(first: 100, after: $cursor) {
+                pageInfo { hasNextPage endCursor }
+                nodes { author { __typename login } body createdAt }
+            }
+        }
+    }
+}
+"""
+
+
+def configure_repo(new_org_repo):
+    """Point the issue listing and label lookups at another repository (org/name)"""
+
+    global repo, org_repo, base_url, repo_id
+
+    org_repo = new_org_repo
+    repo = org_repo.split("/")[1]
+    base_url = f"{root_url}/{org_repo}/issues"
+    repo_id = ""
 
 
 def get_repo():
     """Get repo object for current repo specified in org_repo"""
 
     url = f"{root_url}/{org_repo}"
-    return requests.get(
+    return httputils.get(
         url, auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN)
     ).json()
 
 
 def get_issues_by_label(labels, label_exclusions, pagination=100):
     """Get list of issues by label"""
+
+    return list(iter_issues_by_label(labels, label_exclusions, pagination))
+
+
+def iter_issues_by_label(
+    labels, label_exclusions, pagination=100, since=None, etags=None
+):
+    """Yield issues by label, one page at a time.
+
+    With since, only the issues updated after that time are returned, most recently
+    updated first. With an etags dict, the ETag of each page is sent back in
+    If-None-Match and refreshed, so an unchanged page costs no rate limit.
+    """
     assert 0 < pagination <= 100  # pagination size needs to be set properly
     assert labels  # Labels cannot be None
 
-    issues = []
     page = 0
     url = f"{base_url}"
 
     while True:
         page += 1
         data = {"per_page": pagination, "labels": labels, "page": page}
-        response = requests.get(
-            url, auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN), params=data
+        if since:
+            data.update({"since": since, "sort": "updated", "direction": "desc"})
+
+        page_key = f"{org_repo}:{labels}:{page}"
+        headers = {}
+        if etags is not None and page_key in etags:
+            headers["If-None-Match"] = etags[page_key]
+
+        response = httputils.get(
+            url,
+            auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN),
+            params=data,
+            headers=headers,
         )
 
+        # Issues are sorted by last update, so when a page is unchanged none of the
+        # issues was updated since the previous sync
+        if response.status_code == 304:
+            break
+
+        if etags is not None and "ETag" in response.headers:
+            etags[page_key] = response.headers["ETag"]
+
         if not response.ok:
             print(
                 f"* An unexpected response was returned from GitHub: {response} {response.reason}"
@@ -42,39 +149,234 @@ def get_issues_by_label(labels, label_exclusions, pagination=100):
             exit(1)
 
         # Get all the issues excluding the PRs and specified labels
-        issues.extend(
-            [
-                issue
-                for issue in response.json()
-                if not has_label(issue, label_exclusions)
-                and not issue.get("pull_request")
-            ]
-        )
+        for issue in response.json():
+            if not has_label(issue, label_exclusions) and not issue.get("pull_request"):
+                yield issue
 
         if not "next" in response.links.keys():
             break
 
-    return issues
+
+def search_issues(query, pagination=100, page=1):
+    """Run an issue search query and return the response data"""
+
+    data = {
+        "q": query,
+        "per_page": pagination,
+        "page": page,
+        "sort": "created",
+        "order": "asc",
+    }
+    response = httputils.get(
+        search_url,
+        auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN),
+        params=data,
+    )
+
+    if not response.ok:
+        print(
+            f"* An unexpected response was returned from GitHub: {response} {response.reason}"
+        )
+        print(response.json())
+        exit(1)
+
+    return response.json()
+
+
+def get_search_query(labels, label_exclusions):
+    """Return the search qualifiers of the issues with all labels and none of the exclusions"""
+
+    qualifiers = [f"repo:{org_repo}", "is:issue", "is:open"]
+    qualifiers += [f'label:"{label}"' for label in labels.split(",") if label]
+    qualifiers += [
+        f'-label:"{label}"' for label in label_exclusions.split(",") if label
+    ]
+
+    return " ".join(qualifiers)
+
+
+def iter_issues_search(labels, label_exclusions, pagination=100):
+    """Yield issues by label, filtering exclusions and pull requests on GitHub's side.
+
+    Pages are keyed on the creation time of the last issue instead of numbered: the
+    migration labels issues as it goes, so they leave the results of the query and
+    numbered pages would skip as many issues. This also avoids the 1000 results cap.
+    """
+    assert 0 < pagination <= 100  # pagination size needs to be set properly
+    assert labels  # Labels cannot be None
+
+    query = get_search_query(labels, label_exclusions)
+    fetched_pages = 0
+    last_created = None
+    last_numbers = set()  # Issues already yielded that were created at last_created
+    page = 1
+    while True:
+        page_query = query
+        if last_created:
+            page_query = f"{query} created:>={last_created}"
+        items = search_issues(page_query, pagination, page)["items"]
+        fetched_pages += 1
+        yield from (issue for issue in items if issue["number"] not in last_numbers)
+
+        if len(items) < pagination:
+            break
+        if items[-1]["created_at"] == last_created:
+            # More issues created in the same second than a page holds
+            page += 1
+        else:
+            last_created = items[-1]["created_at"]
+            last_numbers = set()
+            page = 1
+        last_numbers.update(
+            issue["number"] for issue in items if issue["created_at"] == last_created
+        )
+
+    # Pages the label listing would have fetched, excluded issues and pull requests included
+    listed = search_issues(
+        f"repo:{org_repo} is:open "
+        + " ".join(f'label:"{label}"' for label in labels.split(",") if label),
+        pagination=1,
+    )["total_count"]
+    listed_pages = math.ceil(listed / pagination)
+    print(
+        f"* Search API fetched {fetched_pages} pages of issues instead of {listed_pages} "
+        f"({max(listed_pages - fetched_pages, 0)} saved)"
+    )
+
+
+def run_graphql(query, variables):
+    """Run a GraphQL query against GitHub and return its data"""
+
+    # Only queries go through here, they are safe to retry
+    response = httputils.post(
+        graphql_url,
+        auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN),
+        json={"query": query, "variables": variables},
+        idempotent=True,
+    )
+
+    if not response.ok or "errors" in response.json():
+        print(
+            f"* An unexpected response was returned from GitHub: {response} {response.reason}"
+        )
+        print(response.json())
+        exit(1)
+
+    return response.json()["data"]
+
+
+def get_login(actor):
+    """Return the login of a GraphQL actor as the REST API spells it (deleted users are returned as null)"""
+
+    if actor is None:
+        return "ghost"
+    # GraphQL drops the [bot] suffix of app logins, as in stale[bot]
+    if actor.get("__typename") == "Bot":
+        return f"{actor['login']}[bot]"
+    return actor["login"]
+
+
+def get_comment_from_node(node):
+    """Return a GraphQL comment in the shape of the REST API"""
+
+    return {
+        "user": {"login": get_login(node["author"])},
+        "body": node["body"],
+        "created_at": node["createdAt"],
+    }
+
+
+def get_issue_from_node(node):
+    """Return a GraphQL issue in the shape of the REST API, comments included"""
+
+    comments = [get_comment_from_node(comment) for comment in node["comments"]["nodes"]]
+
+    # Follow the comment cursor only for issues with more than one page of comments
+    page_info = node["comments"]["pageInfo"]
+    while page_info["hasNextPage"]:
+        data = run_graphql(
+            comments_query, {"id": node["id"], "cursor": page_info["endCursor"]}
+        )
+        page = data["node"]["comments"]
+        comments.extend(get_comment_from_node(comment) for comment in page["nodes"])
+        page_info = page["pageInfo"]
+
+    return {
+        "number": node["number"],
+        "title": node["title"],
+        "body": node["body"],
+        "html_url": node["url"],
+        "user": {"login": get_login(node["author"])},
+        "labels": node["labels"]["nodes"],
+        "assignees": [
+            {"login": get_login(assignee)} for assignee in node["assignees"]["nodes"]
+        ],
+        "comments_url": f"{base_url}/{node['number']}/comments",
+        "node_id": node["id"],
+        "comment_list": comments,
+    }
+
+
+def iter_issues_graphql(labels, label_exclusions, pagination=50):
+    """Yield issues by label with their comments, one GraphQL page at a time"""
+    assert 0 < pagination <= 100  # pagination size needs to be set properly
+    assert labels  # Labels cannot be None
+
+    global repo_id
+
+    owner, name = org_repo.split("/")
+    label_list = labels.split(",")
+    cursor = None
+
+    while True:
+        data = run_graphql(
+            issues_query,
+            {
+                "owner": owner,
+                "name": name,
+                "labels": label_list,
+                "pagination": pagination,
+                "cursor": cursor,
+            },
+        )
+        repository = data["repository"]
+        repo_id = str(repository["databaseId"])
+
+        for node in repository["issues"]["nodes"]:
+            issue = get_issue_from_node(node)
+            # GraphQL matches any of the labels, the REST API requires all of them
+            issue_labels = {label["name"] for label in issue["labels"]}
+            if set(label_list) <= issue_labels and not has_label(
+                issue, label_exclusions
+            ):
+                yield issue
+
+        page_info = repository["issues"]["pageInfo"]
+        if not page_info["hasNextPage"]:
+            break
+        cursor = page_info["endCursor"]
+
+
+@functools.lru_cache(maxsize=None)
+def get_label_set(label_query):
+    """Return the labels of a comma separated list as a set (cached per list)"""
+
+    return frozenset(label for label in label_query.split(",") if label)
 
 
 def has_label(issue, label_query):
     """Whether an issue has a given label"""
 
-    label_list = label_query.split(",")
-
-    for label_obj in issue["labels"]:
-        for label_name in label_list:
-            if str(label_obj["name"]) == label_name:
-                return True
+    label_set = get_label_set(label_query)
 
-    return False
+    return any(str(label_obj["name"]) in label_set for label_obj in issue["labels"])
 
 
 def get_single_issue(issue_number):
     """Get specific issue data"""
 
     url = f"{base_url}/{issue_number}"
-    return requests.get(
+    return httputils.get(
         url, auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN)
     ).json()
 
@@ -84,72 +386,179 @@ def close_issue(issue_number):
 
     url = f"{base_url}/{issue_number}"
     data = {"state": "closed"}
-    return requests.patch(
+    return httputils.patch(
         url, auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN), json=data
     ).json()
 
 
-def get_issue_comments(issue):
-    """Get comments from given issue dict"""
+def get_issue_comments(issue, pagination=100, since=None):
+    """Get comments from given issue dict (already fetched by the GraphQL backend).
 
-    comment_url = issue["comments_url"]
+    With since, only the comments created after that time are returned.
+    """
 
-    response = requests.get(
-        comment_url, auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN)
-    )
+    if "comment_list" in issue and not since:
+        gh_comments = issue["comment_list"]
+    else:
+        gh_comments = []
+        url = issue["comments_url"]
+        data = {"per_page": pagination}
+        if since:
+            data["since"] = since
+
+        while True:
+            response = httputils.get(
+                url,
+                auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN),
+                params=data,
+            )
+            gh_comments.extend(response.json())
+
+            if not "next" in response.links.keys():
+                break
+            url = response.links["next"]["url"]
+            data = None
 
     # Omit comments from selected bots
     comments = []
     comments.extend(
         [
             comment
-            for comment in response.json()
-            if comment["user"]["login"] != "stale[bot]"
-            and comment["body"] != "dependency_scan failed."
+            for comment in gh_comments
+            if comment["user"]["login"] not in ignored_comment_users
+            and comment["body"] not in ignored_comment_bodies
+            and (not since or comment["created_at"] >= since)
         ]
     )
 
     return comments
 
 
-def add_issue_label(issue_number, label):
-    """Add label to given issue"""
+def add_issue_label(issue_number, label, issue_repo=None):
+    """Add label to given issue (of issue_repo, by default the configured repository)"""
 
-    url = f"{base_url}/{issue_number}/labels"
+    url = f"{root_url}/{issue_repo or org_repo}/issues/{issue_number}/labels"
 
     data = {"labels": [label]}
 
-    response = requests.post(
-        url, auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN), json=data
+    # Adding a label twice leaves a single one
+    response = httputils.post(
+        url,
+        auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN),
+        json=data,
+        idempotent=True,
     )
 
     return response.json()
 
 
-def add_issue_comment(issue_number, comment):
-    """Add comment to given issue"""
+def get_label_id(label):
+    """Get the GraphQL node ID of a label, creating the label if needed"""
 
-    url = f"{base_url}/{issue_number}/comments"
+    owner, name = org_repo.split("/")
+    data = run_graphql(label_query, {"owner": owner, "name": name, "label": label})
+    if data["repository"]["label"]:
+        return data["repository"]["label"]["id"]
+
+    # Unlike the REST API, GraphQL mutations don't create missing labels
+    response = httputils.post(
+        f"{root_url}/{org_repo}/labels",
+        auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN),
+        json={"name": label},
+    )
+    if not response.ok:
+        print(
+            f"* An unexpected response was returned from GitHub: {response} {response.reason}"
+        )
+        print(response.json())
+        exit(1)
+
+    return response.json()["node_id"]
+
+
+def write_back(items, label_id):
+    """Add migration comments and labels to issues with a single GraphQL request.
+
+    Each item is an (issue node ID, comment or None, whether to add the label)
+    tuple. Returns one (comment added, label added) tuple per item. Requests
+    are paced to stay under content_per_minute comments.
+    """
+    assert 0 < len(items) <= writeback_batch_size
+
+    global next_writeback
+
+    declarations = []
+    mutations = []
+    variables = {}
+    if any(add_label for node_id, comment, add_label in items):
+        declarations.append("$label: ID!")
+        variables["label"] = label_id
+    for index, (node_id, comment, add_label) in enumerate(items):
+        declarations.append(f"$subject{index}: ID!")
+        variables[f"subject{index}"] = node_id
+        if comment is not None:
+            declarations.append(f"$body{index}: String!")
+            variables[f"body{index}"] = comment
+            mutations.append(
+                f"comment{index}: addComment(input: {{subjectId: $subject{index}, body: $body{index}}}) {{ clientMutationId }}"
+            )
+        if add_label:
+            mutations.append(
+                f"label{index}: addLabelsToLabelable(input: {{labelableId: $subject{index}, labelIds: [$label]}}) {{ clientMutationId }}"
+            )
+
+    query = f"mutation({', '.join(declarations)}) {{\n" + "\n".join(mutations) + "\n}"
+
+    comment_count = sum(comment is not None for node_id, comment, add_label in items)
+    with writeback_lock:
+        delay = next_writeback - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        next_writeback = time.monotonic() + comment_count * 60 / content_per_minute
+
+    response = httputils.post(
+        graphql_url,
+        auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN),
+        json={"query": query, "variables": variables},
+    )
+
+    try:
+        response_data = response.json()
+    except ValueError:
+        response_data = {}
+    if "errors" in response_data:
+        print(f"* GitHub reported errors while writing back: {response_data['errors']}")
+    data = response_data.get("data") or {}
+
+    return [
+        (
+            comment is None or data.get(f"comment{index}") is not None,
+            not add_label or data.get(f"label{index}") is not None,
+        )
+        for index, (node_id, comment, add_label) in enumerate(items)
+    ]
+
+
+def add_issue_comment(issue_number, comment, issue_repo=None):
+    """Add comment to given issue (of issue_repo, by default the configured repository)"""
+
+    url = f"{root_url}/{issue_repo or org_repo}/issues/{issue_number}/comments"
 
     data = {"body": comment}
 
-    response = requests.post(
+    response = httputils.post(
         url, auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN), json=data
     )
 
     return response.json()
 
 
-def download_image_with_cookie(image_url, save_dir="images"):
-    """Download a private GitHub image using a browser session cookie.
+def download_image_with_cookie(image_url, file):
+    """Download a private GitHub image into a file using a browser session cookie, return its content type.
         When accessing the GitHub user-attachments URL from a private repo, I was getting an SSO sign-in request instead of the image because GitHub’s API token is not enough when SSO is enforced.
     As in our case it's just needed for a one-off for a migration, I ended up authenticating my requests with a browser session cookie, and was able to programmatically download the images of the issue.
     """
 
-    os.makedirs(save_dir, exist_ok=True)
-    filename = image_url.split("/")[-1] + ".png"
-    filepath = os.path.join(save_dir, filename)
-
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36",
         "Cookie": migrationauth.GH_SESSION_COOKIE,  # Use browser session cookie
@@ -157,18 +566,17 @@ def download_image_with_cookie(image_url, save_dir="images"):
         "Referer": "https://github.com/",  # Add referer to mimic browser request
     }
 
-    response = requests.get(
+    response = httputils.get(
         image_url, headers=headers, stream=True, allow_redirects=True
     )
 
     if response.status_code == 200 and "image" in response.headers.get(
         "Content-Type", ""
     ):
-        with open(filepath, "wb") as file:
-            for chunk in response.iter_content(1024):
-                file.write(chunk)
-        print(f"✅ Downloaded image: {filepath}")
-        return filepath
+        for chunk in response.iter_content(httputils.chunk_size):
+            file.write(chunk)
+        print(f"✅ Downloaded image: {image_url}")
+        return response.headers["Content-Type"]
     else:
         print(f"❌ Failed to download image: {image_url} (Code {response.status_code})")
         return None
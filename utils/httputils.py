@@ -0,0 +1,338 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+import utils.metricsutils as metricsutils
+from urllib.parse import urlsplit
+import threading
+import random
+import time
+
+
+# Connection pool settings shared by every GitHub and Jira call
+pool_size = 10
+timeout = 30
+# Size of the chunks streamed to or from disk by downloads and uploads
+chunk_size = 256 * 1024
+
+# Throttling settings: requests per second allowed per host until its headers say otherwise
+default_rate = 10
+default_burst = 10
+host_rates = {}
+max_retries = 5
+backoff_base = 1
+backoff_max = 60
+retry_statuses = {429, 500, 502, 503, 504}
+# Other methods are only sent again when the first attempt was rate limited or never
+# reached the host: after a timeout or a server error, it may have created an issue
+idempotent_methods = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# APIs limited apart from the rest of their host, by path (GitHub counts search and
+# GraphQL requests against their own budgets, named in X-RateLimit-Resource)
+resource_paths = {"/search/": "search", "/graphql": "graphql"}
+default_resource = "core"
+
+sessions = {}
+sessions_lock = threading.Lock()
+budgets = {}
+budgets_lock = threading.Lock()
+
+
+class HostBudget:
+    """Token bucket for one API of a host, tuned from the rate-limit headers it returns"""
+
+    def __init__(self, host, rate, burst, resource=default_resource):
+        self.host = host
+        self.resource = resource
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.remaining = None
+        self.reset = None
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent to this host"""
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def update(self, response):
+        """Learn the remaining budget of the host from a response"""
+
+        headers = response.headers
+        now = time.monotonic()
+
+        with self.lock:
+            remaining = headers.get("X-RateLimit-Remaining")
+            reset = headers.get("X-RateLimit-Reset")
+            resource = headers.get("X-RateLimit-Resource", self.resource)
+            if (
+                remaining is not None
+                and reset is not None
+                and resource == self.resource
+            ):
+                try:
+                    self.remaining = int(remaining)
+                    self.reset = float(reset)
+                except ValueError:
+                    pass
+                else:
+                    # Spread what is left of the budget over the rest of the window
+                    window = max(self.reset - time.time(), 1)
+                    if self.remaining <= 0:
+                        self.blocked_until = max(self.blocked_until, now + window)
+                    else:
+                        self.rate = max(
+                            min(
+                                self.remaining / window,
+                                host_rates.get(self.host, default_rate),
+                            ),
+                            0.1,
+                        )
+
+            retry_after = get_retry_after(response)
+            if retry_after is not None and is_throttled(response):
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def state(self):
+        """Return a snapshot of the budget"""
+
+        with self.lock:
+            return {
+                "rate": self.rate,
+                "tokens": self.tokens,
+                "remaining": self.remaining,
+                "reset": self.reset,
+                "retries": self.retries,
+            }
+
+
+def configure(new_pool_size=None, new_timeout=None, rate_limits=None, retries=None):
+    """Set pool size, per-request timeout and throttling (must be called before the first request)"""
+
+    global pool_size, timeout, max_retries
+
+    if new_pool_size:
+        pool_size = int(new_pool_size)
+    if new_timeout:
+        timeout = float(new_timeout)
+    if rate_limits:
+        host_rates.update(rate_limits)
+    if retries is not None:
+        max_retries = int(retries)
+
+    close_sessions()
+    with budgets_lock:
+        budgets.clear()
+
+
+def get_resource(url):
+    """Return the API of its host a URL counts against"""
+
+    path = urlsplit(url).path
+    for resource_path, resource in resource_paths.items():
+        if resource_path in path:
+            return resource
+
+    return default_resource
+
+
+def get_budget(url):
+    """Return the shared rate-limit budget for the host and API of the given URL"""
+
+    host = urlsplit(url).netloc
+    resource = get_resource(url)
+
+    with budgets_lock:
+        if (host, resource) not in budgets:
+            rate = host_rates.get(host, default_rate)
+            budgets[host, resource] = HostBudget(
+                host, rate, max(default_burst, rate), resource
+            )
+
+        return budgets[host, resource]
+
+
+def get_budget_states():
+    """Return a snapshot of the rate-limit budget of every host and API seen so far"""
+
+    states = {}
+    with budgets_lock:
+        for (host, resource), budget in budgets.items():
+            if resource != default_resource:
+                host = f"{host} ({resource})"
+            states[host] = budget.state()
+
+    return states
+
+
+def get_retry_after(response):
+    """Return the Retry-After delay of a response in seconds, if any"""
+
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is None:
+        return None
+
+    try:
+        return float(retry_after)
+    except ValueError:
+        return None
+
+
+def is_rate_limited(response):
+    """Whether a response was rejected by rate limiting, before the request was processed"""
+
+    if response.status_code == 429:
+        return True
+
+    # GitHub answers 403 instead of 429 when the primary rate limit is exhausted, or
+    # with a Retry-After delay when a secondary rate limit is hit
+    return response.status_code == 403 and (
+        response.headers.get("X-RateLimit-Remaining") == "0"
+        or "Retry-After" in response.headers
+    )
+
+
+def is_throttled(response):
+    """Whether a response was rejected because of rate limiting or a server error"""
+
+    return response.status_code in retry_statuses or is_rate_limited(response)
+
+
+def is_unsent(error):
+    """Whether a connection error happened before the request reached the host"""
+
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def get_backoff(attempt, response=None):
+    """Return the delay before the next attempt, with jitter"""
+
+    if response is not None:
+        retry_after = get_retry_after(response)
+        if retry_after is not None:
+            return retry_after
+
+    delay = min(backoff_max, backoff_base * 2**attempt)
+    return random.uniform(delay / 2, delay)
+
+
+def get_session(url):
+    """Return the keep-alive session for the host of the given URL"""
+
+    host = urlsplit(url).netloc
+
+    with sessions_lock:
+        if host not in sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            sessions[host] = session
+
+        return sessions[host]
+
+
+def close_sessions():
+    """Close all pooled connections"""
+
+    with sessions_lock:
+        for session in sessions.values():
+            session.close()
+        sessions.clear()
+
+
+def request(method, url, retries=None, idempotent=None, **kwargs):
+    """Send a throttled request through the pooled session for the URL's host.
+
+    Requests are retried on rate limiting, and unless they are neither idempotent
+    (by default: their method is) nor known to be unsent, on errors.
+    """
+
+    kwargs.setdefault("timeout", timeout)
+    if retries is None:
+        retries = max_retries
+    if idempotent is None:
+        idempotent = method in idempotent_methods
+
+    session = get_session(url)
+    budget = get_budget(url)
+    attempt = 0
+
+    while True:
+        budget.acquire()
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            metricsutils.record_request(
+                method, url, None, time.perf_counter() - start, error
+            )
+            if attempt >= retries or not (idempotent or is_unsent(error)):
+                raise
+            delay = get_backoff(attempt)
+            print(f"* {method} {url} failed ({error}), retrying in {delay:.1f}s")
+        else:
+            metricsutils.record_request(
+                method,
+                url,
+                response,
+                time.perf_counter() - start,
+                streamed=kwargs.get("stream", False),
+            )
+            budget.update(response)
+            if (
+                not is_throttled(response)
+                or attempt >= retries
+                or not (idempotent or is_rate_limited(response))
+            ):
+                return response
+            delay = get_backoff(attempt, response)
+            print(
+                f"* {method} {url} returned {response.status_code}, retrying in {delay:.1f}s"
+            )
+            response.close()
+
+        with budget.lock:
+            budget.retries += 1
+        metricsutils.record_retry(method, url)
+        attempt += 1
+        time.sleep(delay)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request("PUT", url, **kwargs)
+
+
+def patch(url, **kwargs):
+    return request("PATCH", url, **kwargs)
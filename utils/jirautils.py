@@ -1,10 +1,17 @@
 import migrationauth
-import requests
+import utils.httputils as httputils
 from requests.auth import HTTPBasicAuth
 from pprint import pprint
 import re
 import os
-import utils.ghutils as ghutils
+import uuid
+import mimetypes
+import threading
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import utils.cacheutils as cacheutils
+import utils.metricsutils as metricsutils
 
 
 auth = HTTPBasicAuth(migrationauth.JIRA_EMAIL, migrationauth.JIRA_TOKEN)
@@ -14,11 +21,44 @@ html_url = f"{root_url}/browse"
 issue_url = f"{base_url}/issue"
 project_key = "WAL"
 gh_issue_field = "customfield_12316846"
-data = {"projectKeys": project_key}
 headers = {
     "Content-Type": "application/json",
     "Accept": "application/json",
 }
+upload_workers = 4
+# Files from large_file_size bytes are uploaded on a separate lane shared by all issues
+large_file_size = 10 * 1024 * 1024
+large_upload_workers = 2
+large_upload_lane = None
+large_upload_lane_lock = threading.Lock()
+bulk_size = 50
+# Characters allowed in a comment body by Jira
+comment_max_size = 32767
+user_cache_path = "user_cache.json"
+user_cache_ttl = 24 * 60 * 60
+meta_cache_path = "create_meta.json"
+meta_cache_ttl = 24 * 60 * 60
+image_pattern = re.compile(r"!\[(.*?)\]\((.*?)\)")
+# Every construct starts with one of "`", "!", "[", "*" or a newline (line-level
+# constructs), which lets the regex engine skip plain text quickly
+markdown_pattern = re.compile(
+    r"```(?:(?P<fence_lang>\w+)\n)?(?P<fence_body>(?s:.*?))```"
+    r"|`(?P<code_body>[^`\n]+?)`"
+    r"|!\[(?P<image_alt>.*?)\]\((?P<image_url>.*?)\)"
+    r"|\[(?P<link_text>(?:!\[[^\]\n]*\]\([^)\n]*\)|[^\]\n])*?)\]\((?P<link_url>.*?)\)"
+    r"|\n(?:(?P<header_level>#{1,6}) "
+    r"|> (?P<quote_body>.*)"
+    r"|(?P<ulist_indent>[ \t]*)[-*] "
+    r"|(?P<olist_indent>[ \t]*)\d+\. )"
+    r"|\*\*"
+)
+
+attachment_stats = {"uploaded": 0, "bytes": 0, "duplicates": 0, "failed": 0}
+attachment_stats_lock = threading.Lock()
+
+# Create metadata per project key
+create_metas = {}
+create_meta_lock = threading.Lock()
 
 
 def get_user(user_query):
@@ -27,39 +67,187 @@ def get_user(user_query):
     url = f"{base_url}/user"
     data = {"accountId": user_query}
 
-    response = requests.get(url, headers=headers, params=data, auth=auth)
+    response = httputils.get(url, headers=headers, params=data, auth=auth)
 
     if not response.ok:
         print(
             f"An unexpected response was returned from Jira while trying to get user {user_query}: {response} {response.reason}"
         )
-        exit(1)
+        return None
 
     return response.json()
 
 
-def get_issue_types():
-    """Get types of issues from Jira"""
+def get_users(account_ids, pagination=100):
+    """Get the user objects of account IDs in bulk (unknown IDs are not returned).
+
+    Exits if Jira does not answer, as every user of a missing answer would look unknown.
+    """
+    # https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-users/#api-rest-api-3-user-bulk-get
+
+    url = f"{base_url}/user/bulk"
+    account_ids = list(account_ids)
+    users = []
+
+    for index in range(0, len(account_ids), pagination):
+        data = [
+            ("accountId", account_id)
+            for account_id in account_ids[index : index + pagination]
+        ]
+        data.append(("maxResults", pagination))
+
+        response = httputils.get(url, headers=headers, params=data, auth=auth)
+
+        if not response.ok:
+            print(
+                f"* Error: An unexpected response was returned from Jira while trying to get users: {response} {response.reason}"
+            )
+            exit(1)
+
+        users.extend(response.json()["values"])
+
+    return users
+
+
+def get_active_account_ids(account_ids):
+    """Return the account IDs of active Jira users, cached on disk for user_cache_ttl seconds"""
+
+    try:
+        with open(user_cache_path) as cache_file:
+            user_cache = json.load(cache_file)
+    except (OSError, ValueError):
+        user_cache = {}
+
+    now = time.time()
+    stale_ids = [
+        account_id
+        for account_id in set(account_ids)
+        if account_id not in user_cache
+        or now - user_cache[account_id]["checked"] > user_cache_ttl
+    ]
 
-    url = f"{issue_url}/createmeta"
+    # Only cached once Jira answered for every ID: unknown IDs are then really unknown
+    if stale_ids:
+        active_ids = {
+            user["accountId"] for user in get_users(stale_ids) if user.get("active")
+        }
+        for account_id in stale_ids:
+            user_cache[account_id] = {
+                "active": account_id in active_ids,
+                "checked": now,
+            }
+
+        with open(user_cache_path + ".tmp", "w") as cache_file:
+            json.dump(user_cache, cache_file, indent=2)
+        os.replace(user_cache_path + ".tmp", user_cache_path)
+
+    return {
+        account_id for account_id in account_ids if user_cache[account_id]["active"]
+    }
 
-    response = requests.get(url, headers=headers, params=data, auth=auth)
 
-    return response.json()["projects"][0]["issuetypes"]
+def get_issue_types(project=None):
+    """Get types of issues from Jira"""
+
+    return get_create_meta(project)
 
 
-def get_issue_meta(issue_type_name):
+def get_issue_meta(issue_type_name, project=None):
     """Get meta fields for an issue type"""
 
-    request_data = data
-    request_data["issuetypeNames"] = issue_type_name
-    request_data["expand"] = "projects.issuetypes.fields"
+    for issue_type in get_create_meta(project):
+        if issue_type["name"] == issue_type_name:
+            return issue_type
+
+    return None
+
+
+def get_create_meta(project=None):
+    """Get the issue types of a project (by default project_key) with their fields, loaded once per run.
+
+    The metadata is also kept on disk for meta_cache_ttl seconds.
+    """
+
+    project = project or project_key
+
+    with create_meta_lock:
+        if project in create_metas:
+            return create_metas[project]
+
+        meta_cache = {}
+        try:
+            with open(meta_cache_path) as cache_file:
+                meta_cache = json.load(cache_file)["projects"]
+            if time.time() - meta_cache[project]["checked"] <= meta_cache_ttl:
+                create_metas[project] = meta_cache[project]["issuetypes"]
+                return create_metas[project]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        url = f"{issue_url}/createmeta"
+        request_data = {
+            "projectKeys": project,
+            "expand": "projects.issuetypes.fields",
+        }
+
+        response = httputils.get(url, headers=headers, params=request_data, auth=auth)
+
+        if not response.ok:
+            print(
+                f"An unexpected response was returned from Jira while trying to get the create metadata: {response} {response.reason}"
+            )
+            # Not asked again by every issue, Jira validates them for the rest of the run
+            create_metas[project] = []
+            return []
+
+        create_metas[project] = response.json()["projects"][0]["issuetypes"]
+
+        # The projects of other runs sharing the file are kept
+        if not isinstance(meta_cache, dict):
+            meta_cache = {}
+        meta_cache[project] = {
+            "checked": time.time(),
+            "issuetypes": create_metas[project],
+        }
+        with open(meta_cache_path + ".tmp", "w") as cache_file:
+            json.dump({"projects": meta_cache}, cache_file)
+        os.replace(meta_cache_path + ".tmp", meta_cache_path)
+
+        return create_metas[project]
+
 
-    url = f"{issue_url}/createmeta"
+def validate_issue(props):
+    """Return the problems Jira would report for an issue mapping, checked against the create metadata"""
 
-    response = requests.get(url, headers=headers, params=request_data, auth=auth)
+    project = props.get("project", {}).get("key")
+    issue_types = get_create_meta(project)
+    if not issue_types:
+        return []  # Metadata unavailable, let Jira validate
 
-    return response.json()["projects"][0]["issuetypes"][0]
+    issue_type_name = props["issuetype"]["name"]
+    issue_type = get_issue_meta(issue_type_name, project)
+    if issue_type is None:
+        return [f"Unknown issue type {issue_type_name}"]
+
+    errors = []
+    fields = issue_type.get("fields", {})
+
+    def allowed_names(field):
+        return {value.get("name") for value in fields[field].get("allowedValues", [])}
+
+    if "priority" in fields and props["priority"]:
+        priority_name = props["priority"]["name"]
+        if "allowedValues" in fields["priority"] and priority_name not in allowed_names(
+            "priority"
+        ):
+            errors.append(f"Unknown priority {priority_name}")
+
+    if "components" in fields and "allowedValues" in fields["components"]:
+        for component in props["components"]:
+            if component["name"] not in allowed_names("components"):
+                errors.append(f"Unknown component {component['name']}")
+
+    return errors
 
 
 def get_transitions(issue_key):
@@ -68,7 +256,7 @@ def get_transitions(issue_key):
     url = f"{issue_url}/{issue_key}/transitions"
     data = {"expand": "transitions.fields"}
 
-    return requests.get(url, headers=headers, auth=auth, json=data).json()
+    return httputils.get(url, headers=headers, auth=auth, json=data).json()
 
 
 def do_transition(issue_key, target_status_name):
@@ -83,139 +271,272 @@ def do_transition(issue_key, target_status_name):
     url = f"{issue_url}/{issue_key}/transitions"
     data = {"transition": target_status}
 
-    return requests.post(url, headers=headers, json=data, auth=auth)
+    return httputils.post(url, headers=headers, json=data, auth=auth)
+
 
+def find_image_urls(string: str | None):
+    """Return the URLs of the Markdown images of a string"""
+    if not string:
+        return []
+
+    return [url for alt_text, url in image_pattern.findall(string)]
+
+
+def convert_gh_to_jira_markdown(string: str | None, image_files=None):
+    """Convert GitHub Markdown to Jira formatting, images are taken from the image cache.
 
-def convert_gh_to_jira_markdown(string: str | None):
-    """Convert GitHub Markdown to Jira formatting and download images beforehand."""
+    With image_files (image URL to cached file or None), no image is downloaded or pinned.
+    """
     if not string:
         return "", []
 
     attachments = []  # Store downloaded image paths
 
-    def replace_image(match):
-        """Download image and replace with placeholder."""
-        alt_text, url = match.groups()
-        filepath = ghutils.download_image_with_cookie(url)
+    def replace_image(alt_text, url):
+        """Download image (unless cached) and return its placeholder."""
+        if image_files is not None:
+            filepath = image_files.get(url)
+        else:
+            # Pinned until uploaded, callers unpin the returned attachments
+            filepath = cacheutils.get_image(url, pin=True)
 
         if filepath:
             attachments.append(filepath)
             return f"!{os.path.basename(filepath)}!"  # Temporary placeholder
         return f"[image on GitHub|{url}]"  # If download fails
 
-    # Convert Markdown images and store attachment file paths
-    string = re.sub(r"!\[(.*?)\]\((.*?)\)", replace_image, string)
-
-    # Convert Markdown links: [text](url) → [text|url]
-    string = re.sub(r"\[(.*?)\]\((.*?)\)", r"[\1|\2]", string)
-
-    # Headers
-    string = re.sub(r"(###### )", "h6. ", string)
-    string = re.sub(r"(##### )", "h5. ", string)
-    string = re.sub(r"(#### )", "h4. ", string)
-    string = re.sub(r"(### )", "h3. ", string)
-    string = re.sub(r"(## )", "h2. ", string)
-    string = re.sub(r"(# )", "h1. ", string)
-    # Bold
-    string = string.replace("**", "*")
-    # Inline code
-    string = re.sub(r"`([^`\n]+?)`", r"{{\1}}", string)
-    # Code blocks with language
-    string = re.sub(
-        r"```(\w+)\n(.*?)```",
-        lambda m: f"{{code:{m.group(1)}}}{m.group(2)}{{code}}",
-        string,
-        flags=re.DOTALL,
-    )
-    # Code blocks without language
-    string = re.sub(r"```(.*?)```", r"{code}\1{code}", string, flags=re.DOTALL)
-    # Blockquotes
-    string = re.sub(r"^> (.*)$", r"{quote}\1{quote}", string, flags=re.MULTILINE)
-    # Unordered lists
-    string = re.sub(
-        r"^(\s*)[-*] (.*)$",
-        lambda m: f"{m.group(1)}* {m.group(2)}",
-        string,
-        flags=re.MULTILINE,
-    )
-    # Ordered lists
-    string = re.sub(
-        r"^(\s*)\d+\. (.*)$",
-        lambda m: f"{m.group(1)}# {m.group(2)}",
-        string,
-        flags=re.MULTILINE,
-    )
-
-    return string, attachments
+    with metricsutils.timed("markdown"):
+        converted = convert_markdown(string, replace_image)
+
+    return converted, attachments
+
+
+def convert_markdown(string, replace_image):
+    """Convert GitHub Markdown to Jira formatting in a single scan of the string.
+
+    Code blocks and inline code are copied verbatim, replace_image(alt_text, url)
+    returns the Jira markup of each image.
+    """
+
+    def replace_token(match):
+        token = match.group()
+
+        if token.startswith("```"):
+            if match["fence_lang"]:
+                return f"{{code:{match['fence_lang']}}}{match['fence_body']}{{code}}"
+            return f"{{code}}{match['fence_body']}{{code}}"
+        if token[0] == "`":
+            return f"{{{{{match['code_body']}}}}}"
+        if token[0] == "!":
+            return replace_image(match["image_alt"], match["image_url"])
+        if token[0] == "[":
+            link_text = convert_markdown(match["link_text"], replace_image)
+            return f"[{link_text}|{match['link_url']}]"
+        if token[0] == "*":
+            return "*"  # bold
+        if match["header_level"]:
+            return f"\nh{len(match['header_level'])}. "
+        if match["quote_body"] is not None:
+            quote_body = convert_markdown(match["quote_body"], replace_image)
+            return f"\n{{quote}}{quote_body}{{quote}}"
+        if match["ulist_indent"] is not None:
+            return f"\n{match['ulist_indent']}* "
+        return f"\n{match['olist_indent']}# "
+
+    # The leading newline lets line-level constructs match on the first line
+    return markdown_pattern.sub(replace_token, "\n" + string)[1:]
+
+
+class MultipartFile:
+    """Multipart body streaming a file from disk in chunks, read again on each retry"""
+
+    def __init__(self, filepath, field="file"):
+        self.filepath = filepath
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+
+        filename = os.path.basename(filepath).replace('"', "%22")
+        file_type = mimetypes.guess_type(filepath)[0] or "application/octet-stream"
+        self.head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: {file_type}\r\n\r\n"
+        ).encode()
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+
+    def __len__(self):
+        # A known length lets requests send a Content-Length instead of chunked encoding
+        return len(self.head) + os.path.getsize(self.filepath) + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        with open(self.filepath, "rb") as file:
+            yield from iter(lambda: file.read(httputils.chunk_size), b"")
+        yield self.tail
 
 
 def upload_image_to_jira(issue_key, filepath):
     """Upload an image to JIRA and return the filename."""
-    with open(filepath, "rb") as file:
-        headers = {"X-Atlassian-Token": "no-check"}
-        response = requests.post(
-            f"{issue_url}/{issue_key}/attachments",
-            auth=auth,
-            headers=headers,
-            files={"file": (filepath, file)},
-        )
+    body = MultipartFile(filepath)
+    headers = {"X-Atlassian-Token": "no-check", "Content-Type": body.content_type}
+    response = httputils.post(
+        f"{issue_url}/{issue_key}/attachments",
+        auth=auth,
+        headers=headers,
+        data=body,
+    )
 
     if response.status_code == 200:
         filename = os.path.basename(filepath)
         print(f"✅ Uploaded image to JIRA: {filename}")
+        with attachment_stats_lock:
+            attachment_stats["uploaded"] += 1
+            attachment_stats["bytes"] += os.path.getsize(filepath)
         return filename
     else:
         print(f"❌ Failed to upload image {filepath} (Code {response.status_code})")
+        with attachment_stats_lock:
+            attachment_stats["failed"] += 1
         return None
 
 
+def upload_attachments(issue_key, filepaths, skip=None, on_upload=None):
+    """Upload the files of an issue in parallel, once per distinct content.
+
+    Files for which skip(content_hash) is true are not uploaded, and
+    on_upload(content_hash, filename) is called after each successful upload.
+    """
+
+    unique_paths = {}
+    for filepath in filepaths:
+        content_hash = cacheutils.get_file_hash(filepath)
+        if content_hash in unique_paths:
+            with attachment_stats_lock:
+                attachment_stats["duplicates"] += 1
+        elif not (skip and skip(content_hash)):
+            unique_paths[content_hash] = filepath
+
+    def upload(content_hash, filepath):
+        filename = upload_image_to_jira(issue_key, filepath)
+        if filename and on_upload:
+            on_upload(content_hash, filename)
+        return filename
+
+    # Large files go to the shared lane so they don't hold the slots of small ones
+    with ThreadPoolExecutor(max_workers=upload_workers) as executor:
+        futures = []
+        for content_hash, filepath in unique_paths.items():
+            lane = executor
+            if os.path.getsize(filepath) >= large_file_size:
+                lane = get_large_upload_lane()
+            futures.append(lane.submit(upload, content_hash, filepath))
+
+        return [future.result() for future in futures]
+
+
+def get_large_upload_lane():
+    """Return the executor uploading large files, shared by every issue"""
+
+    global large_upload_lane
+
+    with large_upload_lane_lock:
+        if large_upload_lane is None:
+            large_upload_lane = ThreadPoolExecutor(
+                max_workers=large_upload_workers, thread_name_prefix="large_upload"
+            )
+
+        return large_upload_lane
+
+
+def get_issue_fields(props):
+    """Return the Jira fields of an issue mapping"""
+
+    return {
+        "project": props.get("project") or {"key": project_key},
+        "issuetype": props["issuetype"],
+        "components": props["components"],
+        "summary": props["summary"],
+        "description": props["description"],
+        "reporter": props["reporter"],
+        "assignee": props["assignee"],
+        "priority": props["priority"],
+        "labels": props["labels"],
+        # Read back by get_gh_issue_index to skip issues migrated by earlier runs
+        gh_issue_field: props[gh_issue_field],
+    }
+
+
 def create_issue(props):
     """Create Jira issue"""
     # https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-issues/#api-rest-api-3-issue-post
 
     url = issue_url
-    issue_type = props["issuetype"]
-    converted_description, image_paths = convert_gh_to_jira_markdown(
-        props["description"]
-    )
-
-    request_data = {
-        "fields": {
-            "project": {"key": project_key},
-            "issuetype": issue_type,
-            "components": props["components"],
-            "summary": props["summary"],
-            "description": converted_description,  # Add converted description
-            "reporter": props["reporter"],
-            "assignee": props["assignee"],
-            "priority": props["priority"],
-            "labels": props["labels"],
-        }
-    }
+    request_data = {"fields": get_issue_fields(props)}
 
     # Step 3: Create the issue in JIRA
     # pprint(request_data)
-    response = requests.post(url, json=request_data, headers=headers, auth=auth)
+    response = httputils.post(url, json=request_data, headers=headers, auth=auth)
 
     if not response.ok:
         print(
             f"❌ Failed to create issue in JIRA: {response.status_code} {response.reason}"
         )
-        print(response.json())
-        exit(1)
+        print(response.text)
+        return {}
 
     issue_key = response.json().get("key")
     print(f"✅ Created JIRA issue: {issue_key}")
 
-    # Step 4: Upload attachments (images)
-    if image_paths:
-        print("📎 Uploading attachments...")
-        for image_path in image_paths:
-            upload_image_to_jira(issue_key, image_path)
-
     return response.json()
 
 
+def create_issues(props_list):
+    """Create up to bulk_size Jira issues in one request, return one response per issue.
+
+    Responses of created issues hold their "key" and "self", the others hold
+    the "errors" returned by Jira for them.
+    """
+    # https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-issues/#api-rest-api-3-issue-bulk-post
+    assert 0 < len(props_list) <= bulk_size  # Jira creates at most 50 issues per call
+
+    url = f"{issue_url}/bulk"
+    request_data = {
+        "issueUpdates": [{"fields": get_issue_fields(props)} for props in props_list]
+    }
+
+    response = httputils.post(url, json=request_data, headers=headers, auth=auth)
+
+    try:
+        response_data = response.json()
+    except ValueError:
+        response_data = {}
+
+    results = [None] * len(props_list)
+    for error in response_data.get("errors", []):
+        results[error["failedElementNumber"]] = {
+            "errors": error.get("elementErrors", error)
+        }
+
+    # Created issues are returned in request order, without the failed elements
+    created_issues = iter(response_data.get("issues", []))
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = next(
+                created_issues,
+                {"errors": f"{response.status_code} {response.reason}"},
+            )
+
+    issue_keys = [result["key"] for result in results if "key" in result]
+    if issue_keys:
+        print(f"✅ Created JIRA issues: {', '.join(issue_keys)}")
+    if len(issue_keys) < len(results):
+        print(
+            f"❌ Failed to create {len(results) - len(issue_keys)} issues in JIRA: {response.status_code} {response.reason}"
+        )
+
+    return results
+
+
 def update_issue(issue_key, data):
     """Update existing Jira issue"""
 
@@ -223,13 +544,13 @@ def update_issue(issue_key, data):
 
     request_data = {"update": {}, "fields": data}
 
-    return requests.put(url, headers=headers, json=request_data, auth=auth)
+    return httputils.put(url, headers=headers, json=request_data, auth=auth)
 
 
 def get_issue_from_url(api_url):
     """Get specific issue data given API URL"""
 
-    return requests.get(api_url, headers=headers, auth=auth)
+    return httputils.get(api_url, headers=headers, auth=auth)
 
 
 def get_single_issue(issue_key):
@@ -242,23 +563,56 @@ def get_single_issue(issue_key):
     return response.json()
 
 
-def search_issues(jql_query):
+def search_issues(jql_query, fields=None, start_at=0, max_results=50):
     """Get issues based on JQL query"""
     # https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-issue-search/#api-rest-api-3-search-post
 
     url = f"{base_url}/search"
 
-    return requests.post(
-        url,
-        headers=headers,
-        auth=auth,
-        json={
-            "jql": jql_query,
-            # 'fields': ['status']
-        },
+    request_data = {"jql": jql_query, "startAt": start_at, "maxResults": max_results}
+    if fields is not None:
+        request_data["fields"] = fields
+
+    # Searches only read, they are safe to retry
+    return httputils.post(
+        url, headers=headers, auth=auth, json=request_data, idempotent=True
     ).json()
 
 
+def iter_search_issues(jql_query, fields=None, pagination=100):
+    """Yield every issue matching a JQL query, following pagination"""
+
+    start_at = 0
+
+    while True:
+        response = search_issues(jql_query, fields, start_at, pagination)
+        if "issues" not in response:
+            print(f"An unexpected response was returned from Jira: {response}")
+            exit(1)
+
+        yield from response["issues"]
+
+        start_at += len(response["issues"])
+        if not response["issues"] or start_at >= response["total"]:
+            break
+
+
+def get_gh_issue_index(project=None):
+    """Return the keys of the Jira issues of a project (by default project_key) linked to each GitHub issue URL"""
+
+    custom_field_index = gh_issue_field.split("_")[1]
+    jql_query = (
+        f"project = {project or project_key} AND cf[{custom_field_index}] IS NOT EMPTY"
+    )
+
+    gh_issue_index = {}
+    for issue in iter_search_issues(jql_query, fields=[gh_issue_field]):
+        gh_issue_url = issue["fields"][gh_issue_field]
+        gh_issue_index.setdefault(gh_issue_url, []).append(issue["key"])
+
+    return gh_issue_index
+
+
 def add_comment(issue_key, props):
     """Add comment given issue key and props"""
 
@@ -272,6 +626,6 @@ def add_comment_from_url(api_url, props):
 
     request_data = {"body": props["body"]}
 
-    response = requests.post(api_url, headers=headers, auth=auth, json=request_data)
+    response = httputils.post(api_url, headers=headers, auth=auth, json=request_data)
 
     return response.json()
@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+
+
+# Append-only JSONL journal recording each migration step per GitHub issue number
+journal_path = "migration_journal.jsonl"
+
+entries = {}
+entries_lock = threading.Lock()
+# Steps are appended through one handle, opened on the first step
+writer = None
+write_lock = threading.Lock()
+# Steps still read once an issue is migrated (by prepare_issue and --sync), the others
+# (its mapping with every converted comment) are dropped from memory
+finished_steps = {"labelled", "created", "synced_comment"}
+
+
+def open_journal(path=None, resume=False):
+    """Load the journal when resuming, otherwise start a new one"""
+
+    global journal_path, writer
+
+    if path:
+        journal_path = path
+
+    with write_lock:
+        if writer:
+            writer.close()
+        writer = None
+
+    with entries_lock:
+        entries.clear()
+
+        if not resume:
+            open(journal_path, "w").close()
+            return
+
+        if not os.path.exists(journal_path):
+            return
+
+        with open(journal_path) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash, ignore it
+                    continue
+                steps = entries.setdefault(str(entry["issue"]), {})
+                steps[step_key(entry["step"], entry.get("item"))] = entry
+
+        for issue_number, steps in entries.items():
+            if "labelled" in steps:
+                entries[issue_number] = get_finished_steps(steps)
+
+
+def get_finished_steps(steps):
+    """Return the steps of a migrated issue kept in memory"""
+
+    return {
+        key: entry for key, entry in steps.items() if entry["step"] in finished_steps
+    }
+
+
+def step_key(step, item=None):
+    """Return the key of a step, items distinguish repeated steps (comments, attachments)"""
+
+    if item is None:
+        return step
+    return f"{step}:{item}"
+
+
+def record(issue_number, step, item=None, **data):
+    """Append a completed step to the journal, and mark it done once it is on disk"""
+
+    global writer
+
+    entry = {"issue": issue_number, "step": step}
+    if item is not None:
+        entry["item"] = item
+    entry.update(data)
+    line = json.dumps(entry) + "\n"
+
+    with write_lock:
+        if writer is None:
+            writer = open(journal_path, "a")
+        writer.write(line)
+        writer.flush()
+        file_descriptor = writer.fileno()
+
+    # Outside the locks, so other threads keep appending and reading the journal while
+    # this one waits for the disk
+    os.fsync(file_descriptor)
+
+    with entries_lock:
+        entries.setdefault(str(issue_number), {})[step_key(step, item)] = entry
+
+
+def release(issue_number):
+    """Drop from memory the steps of an issue that left the migration, once it is migrated.
+
+    They stay in the journal file, for --resume.
+    """
+
+    with entries_lock:
+        steps = entries.pop(str(issue_number), {})
+        finished = get_finished_steps(steps)
+        if "labelled" in finished:
+            entries[str(issue_number)] = finished
+
+
+def get_step(issue_number, step, item=None):
+    """Return the journal entry of a completed step, or None"""
+
+    with entries_lock:
+        return entries.get(str(issue_number), {}).get(step_key(step, item))
+
+
+def is_done(issue_number, step, item=None):
+    """Whether a step has already been completed for an issue"""
+
+    return get_step(issue_number, step, item) is not None
@@ -0,0 +1,366 @@
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import bisect
+import json
+import os
+import re
+import threading
+import time
+
+
+# Latency histograms per endpoint and per stage, with fixed buckets so recording
+# a sample is a bisect and a few additions under a lock
+enabled = True
+metrics_path = "run_metrics.json"
+textfile_path = None
+buckets = [
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+]
+
+# Path segments holding identifiers (numbers, issue keys, hashes) are grouped
+id_segment = re.compile(r"[^/]*\d[^/]*")
+
+endpoints = {}
+stages = {}
+# CPU seconds per stage, summed across threads and transform processes
+stage_cpu = {}
+headroom = {}
+metrics_lock = threading.Lock()
+
+
+class Histogram:
+    """Latency samples counted per bucket"""
+
+    def __init__(self):
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding the q quantile"""
+
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return (
+                    min(buckets[index], self.max) if index < len(buckets) else self.max
+                )
+
+        return 0
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": dict(
+                zip([str(bound) for bound in buckets] + ["+Inf"], self.counts)
+            ),
+        }
+
+
+def configure(new_enabled=None, new_metrics_path=None, new_textfile_path=None):
+    """Enable or disable metrics and set the files written by dump"""
+
+    global enabled, metrics_path, textfile_path
+
+    if new_enabled is not None:
+        enabled = bool(new_enabled)
+    if new_metrics_path:
+        metrics_path = new_metrics_path
+    if new_textfile_path:
+        textfile_path = new_textfile_path
+
+
+def get_endpoint(method, url):
+    """Return the endpoint of a request, e.g. GET api.github.com/repos/org/repo/issues/:id"""
+
+    parts = urlsplit(url)
+    path = id_segment.sub(":id", parts.path.rstrip("/"))
+
+    return f"{method} {parts.netloc}{path}"
+
+
+def get_endpoint_stats(endpoint):
+    """Return the counters of an endpoint (metrics_lock must be held)"""
+
+    if endpoint not in endpoints:
+        endpoints[endpoint] = {
+            "latency": Histogram(),
+            "statuses": {},
+            "retries": 0,
+            "bytes_out": 0,
+            "bytes_in": 0,
+        }
+
+    return endpoints[endpoint]
+
+
+def get_body_size(body):
+    """Return the size of a request body, streamed bodies included when their length is known"""
+
+    try:
+        return len(body)
+    except TypeError:
+        return 0
+
+
+def record_request(method, url, response, seconds, error=None, streamed=False):
+    """Record one attempt of an HTTP request (response is None when it raised)"""
+
+    if not enabled:
+        return
+
+    endpoint = get_endpoint(method, url)
+    if response is None:
+        status = type(error).__name__
+        bytes_out = bytes_in = 0
+        remaining = None
+    else:
+        status = str(response.status_code)
+        bytes_out = get_body_size(response.request.body)
+        # Streamed bodies are not read here, their size comes from the headers
+        if streamed:
+            bytes_in = int(response.headers.get("Content-Length") or 0)
+        else:
+            bytes_in = len(response.content or b"")
+        remaining = response.headers.get("X-RateLimit-Remaining")
+
+    host = urlsplit(url).netloc
+    with metrics_lock:
+        stats = get_endpoint_stats(endpoint)
+        stats["latency"].observe(seconds)
+        stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+        stats["bytes_out"] += bytes_out
+        stats["bytes_in"] += bytes_in
+
+        if remaining is not None and remaining.isdigit():
+            remaining = int(remaining)
+            limit = response.headers.get("X-RateLimit-Limit")
+            host_headroom = headroom.setdefault(
+                host, {"min_remaining": remaining, "remaining": remaining}
+            )
+            host_headroom["min_remaining"] = min(
+                host_headroom["min_remaining"], remaining
+            )
+            host_headroom["remaining"] = remaining
+            if limit and limit.isdigit():
+                host_headroom["limit"] = int(limit)
+
+
+def record_retry(method, url):
+    """Count a retried request"""
+
+    if not enabled:
+        return
+
+    with metrics_lock:
+        get_endpoint_stats(get_endpoint(method, url))["retries"] += 1
+
+
+def record_duration(stage, seconds, cpu_seconds=None):
+    """Record the duration of a processing stage (e.g. markdown conversion)"""
+
+    if not enabled:
+        return
+
+    with metrics_lock:
+        stages.setdefault(stage, Histogram()).observe(seconds)
+        if cpu_seconds is not None:
+            stage_cpu[stage] = stage_cpu.get(stage, 0) + cpu_seconds
+
+
+@contextmanager
+def timed(stage):
+    """Record the duration and CPU time of the wrapped block as a stage"""
+
+    start = time.perf_counter()
+    start_cpu = time.thread_time()
+    try:
+        yield
+    finally:
+        record_duration(
+            stage, time.perf_counter() - start, time.thread_time() - start_cpu
+        )
+
+
+def get_metrics():
+    """Return a snapshot of every metric"""
+
+    with metrics_lock:
+        return {
+            "endpoints": {
+                endpoint: dict(
+                    stats,
+                    latency=stats["latency"].to_dict(),
+                    statuses=dict(stats["statuses"]),
+                )
+                for endpoint, stats in endpoints.items()
+            },
+            "stages": {
+                stage: dict(histogram.to_dict(), cpu=stage_cpu.get(stage))
+                for stage, histogram in stages.items()
+            },
+            "rate_limit_headroom": {
+                host: dict(state) for host, state in headroom.items()
+            },
+        }
+
+
+def format_size(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def print_summary():
+    """Print a table of the requests and stage durations of the run"""
+
+    if not enabled:
+        return
+
+    metrics = get_metrics()
+    if not metrics["endpoints"] and not metrics["stages"]:
+        return
+
+    print("* Run metrics:")
+    print(
+        f"  {'Endpoint':<70} {'Calls':>7} {'Errors':>6} {'Retries':>7} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'Max ms':>8} {'Sent':>9} {'Received':>9}"
+    )
+    for endpoint, stats in sorted(
+        metrics["endpoints"].items(), key=lambda item: -item[1]["latency"]["sum"]
+    ):
+        latency = stats["latency"]
+        errors = sum(
+            count
+            for status, count in stats["statuses"].items()
+            if not status.isdigit() or int(status) >= 400
+        )
+        print(
+            f"  {endpoint[:70]:<70} {latency['count']:>7} {errors:>6} {stats['retries']:>7} "
+            f"{latency['p50'] * 1000:>8.0f} {latency['p95'] * 1000:>8.0f} "
+            f"{latency['max'] * 1000:>8.0f} {format_size(stats['bytes_out']):>9} "
+            f"{format_size(stats['bytes_in']):>9}"
+        )
+    for stage, latency in metrics["stages"].items():
+        cpu = f", cpu {latency['cpu']:.1f} s" if latency["cpu"] is not None else ""
+        print(
+            f"  {'stage ' + stage:<70} {latency['count']:>7} {'':>6} {'':>7} "
+            f"{latency['p50'] * 1000:>8.1f} {latency['p95'] * 1000:>8.1f} "
+            f"{latency['max'] * 1000:>8.1f}  total {latency['sum']:.1f} s{cpu}"
+        )
+    for host, state in metrics["rate_limit_headroom"].items():
+        limit = f" of {state['limit']}" if "limit" in state else ""
+        print(
+            f"  Rate limit headroom for {host}: {state['remaining']}{limit} left, "
+            f"lowest {state['min_remaining']}"
+        )
+
+
+def get_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def format_histogram(name, labels, histogram):
+    """Return the Prometheus text lines of a histogram"""
+
+    lines = []
+    cumulative = 0
+    for bound, count in zip(buckets + ["+Inf"], histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+    return lines
+
+
+def get_textfile():
+    """Return the metrics in the Prometheus text exposition format"""
+
+    lines = [
+        "# TYPE migration_http_request_duration_seconds histogram",
+        "# TYPE migration_http_requests_total counter",
+        "# TYPE migration_http_retries_total counter",
+        "# TYPE migration_http_sent_bytes_total counter",
+        "# TYPE migration_http_received_bytes_total counter",
+        "# TYPE migration_stage_duration_seconds histogram",
+        "# TYPE migration_stage_cpu_seconds_total counter",
+        "# TYPE migration_rate_limit_remaining gauge",
+    ]
+    with metrics_lock:
+        for endpoint, stats in endpoints.items():
+            labels = f'endpoint="{get_label(endpoint)}"'
+            lines += format_histogram(
+                "migration_http_request_duration_seconds", labels, stats["latency"]
+            )
+            for status, count in stats["statuses"].items():
+                lines.append(
+                    f'migration_http_requests_total{{{labels},status="{get_label(status)}"}} {count}'
+                )
+            lines.append(f"migration_http_retries_total{{{labels}}} {stats['retries']}")
+            lines.append(
+                f"migration_http_sent_bytes_total{{{labels}}} {stats['bytes_out']}"
+            )
+            lines.append(
+                f"migration_http_received_bytes_total{{{labels}}} {stats['bytes_in']}"
+            )
+        for stage, histogram in stages.items():
+            lines += format_histogram(
+                "migration_stage_duration_seconds",
+                f'stage="{get_label(stage)}"',
+                histogram,
+            )
+        for stage, cpu_seconds in stage_cpu.items():
+            lines.append(
+                f'migration_stage_cpu_seconds_total{{stage="{get_label(stage)}"}} {cpu_seconds}'
+            )
+        for host, state in headroom.items():
+            lines.append(
+                f'migration_rate_limit_remaining{{host="{get_label(host)}"}} {state["remaining"]}'
+            )
+
+    return "\n".join(lines) + "\n"
+
+
+def dump():
+    """Atomically write the metrics as JSON, and as a Prometheus textfile if configured"""
+
+    if not enabled:
+        return
+
+    with open(metrics_path + ".tmp", "w") as metrics_file:
+        json.dump(get_metrics(), metrics_file, indent=2)
+    os.replace(metrics_path + ".tmp", metrics_path)
+
+    if textfile_path:
+        with open(textfile_path + ".tmp", "w") as textfile:
+            textfile.write(get_textfile())
+        os.replace(textfile_path + ".tmp", textfile_path)
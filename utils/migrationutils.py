@@ -1,8 +1,17 @@
 import utils.ghutils as ghutils
 import utils.jirautils as jirautils
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import time
 
 jira_product_versions = {}
-gh_repo_id = ""
+
+# Packed comments are separated by a horizontal rule
+comment_separator = "\n\n----\n"
+
+# User mapping of the transform processes, set by init_transform
+transform_user_mapping = None
+transform_default_user = ""
 
 
 def user_map(gh_username, user_mapping, default_user=""):
@@ -18,63 +27,132 @@ def user_map(gh_username, user_mapping, default_user=""):
     return {"id": user_id}
 
 
-def type_map(gh_labels):
-    """Return the Jira issue type from a given GitHub label"""
+default_type_map = {"task": "Task", "bug": "Bug", "user_story": "Story", "Epic": "Epic"}
+default_priority_map = {
+    "blocker (P0)": "Blocker",
+    "Priority/P1": "Critical",
+    "Priority/P2": "Normal",
+    "Priority/P3": "Minor",
+}
+default_severity_map = {
+    "Severity 1 - Urgent": "Critical",
+    "Severity 2 - Major": "Moderate",
+    "Severity 3 - Minor": "Low",
+}
+
+
+class LabelRules:
+    """Label lookup tables compiled once, resolving every label-mapped field in one pass"""
+
+    def __init__(self, type_map=None, priority_map=None, severity_map=None):
+        self.type_map = dict(default_type_map if type_map is None else type_map)
+        # Labels mapped to an empty value are ignored
+        self.priority_map = {
+            label: value
+            for label, value in (
+                default_priority_map if priority_map is None else priority_map
+            ).items()
+            if value != ""
+        }
+        self.severity_map = {
+            label: value
+            for label, value in (
+                default_severity_map if severity_map is None else severity_map
+            ).items()
+            if value != ""
+        }
+
+        # One lookup per label: (type, priority, severity) for every mapped label
+        self.rules = {
+            label: (
+                self.type_map.get(label),
+                self.priority_map.get(label),
+                self.severity_map.get(label),
+            )
+            for label in set(self.type_map)
+            | set(self.priority_map)
+            | set(self.severity_map)
+        }
+
+    def resolve(self, gh_labels):
+        """Return the type, priority, severity and Jira labels of GitHub labels"""
+
+        issue_type = None
+        priority = None
+        severity = None
+        labels = []
+
+        for label in gh_labels:
+            label_name = str(label["name"])
+            labels.append(label_name.replace(" ", "_"))
+            rule = self.rules.get(label_name)
+            if rule is None:
+                continue
+            issue_type = issue_type or rule[0]
+            priority = priority or rule[1]
+            severity = severity or rule[2]
+
+        return {
+            "type": issue_type or "Task",
+            "priority": {"name": priority or "Undefined"},
+            "severity": {"value": severity} if severity else None,
+            "labels": labels,
+        }
+
+
+label_rules = LabelRules()
+
+
+def configure_labels(type_map=None, priority_map=None, severity_map=None):
+    """Replace the label mapping tables (typically from config.json)"""
+
+    global label_rules
+
+    label_rules = LabelRules(type_map, priority_map, severity_map)
+
+
+def validate_user_map(user_mapping, default_user):
+    """Return the user mapping with inactive or unknown Jira accounts replaced by the default user"""
+    assert user_mapping != None  # user_mapping cannot be None
 
-    type_map = {"task": "Task", "bug": "Bug", "user_story": "Story", "Epic": "Epic"}
+    active_ids = jirautils.get_active_account_ids(
+        set(user_mapping.values()) | {default_user}
+    )
 
-    for label in gh_labels:
-        label_name = str(label["name"])
-        if label_name in type_map:
-            return type_map[label_name]
+    if default_user not in active_ids:
+        print(
+            f"* Error: The default Jira user {default_user} is not an active Jira account."
+        )
+        exit(1)
 
-    return "Task"
+    valid_mapping = {}
+    for gh_username, user_id in user_mapping.items():
+        if user_id not in active_ids:
+            print(
+                f"* Warning: Jira account {user_id} of {gh_username} is not active, using the default Jira user"
+            )
+            user_id = default_user
+        valid_mapping[gh_username] = user_id
 
+    return valid_mapping
 
-def priority_map(gh_labels):
-    """Return the Jira priority from a given GitHub label"""
 
-    priority_map = {
-        "blocker (P0)": "Blocker",
-        "Priority/P1": "Critical",
-        "Priority/P2": "Normal",
-        "Priority/P3": "Minor",
-    }
+def type_map(gh_labels):
+    """Return the Jira issue type from a given GitHub label"""
+
+    return label_rules.resolve(gh_labels)["type"]
 
-    priority = {"name": "Undefined"}
 
-    for label in gh_labels:
-        label_name = str(label["name"])
-        if label_name in priority_map:
-            if priority_map[label_name] != "":
-                priority["name"] = priority_map[label_name]
-                break
+def priority_map(gh_labels):
+    """Return the Jira priority from a given GitHub label"""
 
-    return priority
+    return label_rules.resolve(gh_labels)["priority"]
 
 
 def severity_map(gh_labels):
     """Return the Jira severity from a given GitHub label"""
 
-    severity_map = {
-        "Severity 1 - Urgent": "Critical",
-        "Severity 2 - Major": "Moderate",
-        "Severity 3 - Minor": "Low",
-    }
-
-    severity = {}
-
-    for label in gh_labels:
-        label_name = str(label["name"])
-        if label_name in severity_map:
-            if severity_map[label_name] != "":
-                severity["value"] = severity_map[label_name]
-                break
-
-    if "value" in severity:
-        return severity
-
-    return None
+    return label_rules.resolve(gh_labels)["severity"]
 
 
 def status_map(pipeline, issue_type):
@@ -106,11 +184,11 @@ def status_map(pipeline, issue_type):
     return None
 
 
-def issue_map(gh_issue, user_mapping, default_user):
+def issue_map(gh_issue, user_mapping, default_user, image_files=None):
     """Return a dict for Jira to process from a given GitHub issue"""
     assert user_mapping != None  # user_mapping cannot be None
 
-    gh_labels = gh_issue["labels"]
+    label_fields = label_rules.resolve(gh_issue["labels"])
 
     assignee = None
     contributors = []
@@ -122,24 +200,13 @@ def issue_map(gh_issue, user_mapping, default_user):
             else:
                 assignee = assignee_id
 
-    # Make sure a string is returned for the issue body
-    issue_body = ""
-    if gh_issue["body"]:
-        issue_body = gh_issue["body"]
+    # Convert the issue body, downloading its images as attachments of the issue
+    issue_body, image_paths = jirautils.convert_gh_to_jira_markdown(
+        gh_issue["body"], image_files
+    )
 
     issue_title = gh_issue["title"]
-    issue_type = type_map(gh_labels)
-
-    # Fetch repo ID if not already populated
-    global gh_repo_id
-    if gh_repo_id == "":
-        gh_repo_id = str(ghutils.get_repo()["id"])
-
-    # Handle labels
-    labels = []
-    for label in gh_labels:
-        label_name = str(label["name"])
-        labels.append(label_name.replace(" ", "_"))
+    issue_type = label_fields["type"]
 
     issue_mapping = {
         "issuetype": {"name": issue_type},
@@ -148,22 +215,127 @@ def issue_map(gh_issue, user_mapping, default_user):
         "description": issue_body,
         "reporter": user_map(gh_issue["user"]["login"], user_mapping, default_user),
         "assignee": assignee,
-        "priority": priority_map(gh_labels),
-        "labels": labels,
+        "priority": label_fields["priority"],
+        "labels": label_fields["labels"],
         jirautils.gh_issue_field: gh_issue["html_url"],
     }
 
-    return issue_mapping
+    return issue_mapping, image_paths
 
 
-def comment_map(gh_comment):
+def comment_map(gh_comment, image_files=None):
     """Return a dict for Jira to process from a given GitHub comment"""
 
     gh_user = gh_comment["user"]["login"]
     converted_description, image_paths = jirautils.convert_gh_to_jira_markdown(
-        gh_comment["body"]
+        gh_comment["body"], image_files
     )
 
     return {
         "body": f'{gh_comment["created_at"]} @{gh_user}\n{converted_description}'
     }, image_paths
+
+
+def pack_comments(jira_comments, max_size):
+    """Pack consecutive Jira comments into as few comments of at most max_size characters as possible.
+
+    Return (comment, number of comments packed in it) tuples, longer comments are kept alone.
+    """
+
+    groups = []
+    size = 0
+    for jira_comment in jira_comments:
+        body = jira_comment["body"]
+        if groups and size + len(comment_separator) + len(body) <= max_size:
+            groups[-1].append(body)
+            size += len(comment_separator) + len(body)
+        else:
+            groups.append([body])
+            size = len(body)
+
+    return [({"body": comment_separator.join(group)}, len(group)) for group in groups]
+
+
+def transform_issue(
+    gh_issue, gh_comments, user_mapping, default_user, image_files=None
+):
+    """Return the Jira issue, comments and attachments of a GitHub issue and its comments.
+
+    With image_files, the transform makes no request and can run in another process.
+    """
+
+    jira_issue, attachments = issue_map(
+        gh_issue, user_mapping, default_user, image_files
+    )
+
+    # Images of the comments are attached to the issue
+    jira_comments = []
+    for gh_comment in gh_comments:
+        jira_comment, image_paths = comment_map(gh_comment, image_files)
+        jira_comments.append(jira_comment)
+        attachments += image_paths
+
+    return jira_issue, jira_comments, attachments
+
+
+def init_transform(rules, repo, gh_issue_field, user_mapping, default_user):
+    """Set up a transform process with the label rules and user mapping of the run"""
+
+    global label_rules, transform_user_mapping, transform_default_user
+
+    label_rules = rules
+    ghutils.repo = repo
+    jirautils.gh_issue_field = gh_issue_field
+    transform_user_mapping = user_mapping
+    transform_default_user = default_user
+
+
+def transform_batch(items):
+    """Transform (issue, image_files) items, issues carrying their comment_list.
+
+    Return the result of each item with the wall and CPU seconds spent on it.
+    """
+
+    results = []
+    for gh_issue, image_files in items:
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        result = transform_issue(
+            gh_issue,
+            gh_issue["comment_list"],
+            transform_user_mapping,
+            transform_default_user,
+            image_files,
+        )
+        results.append(
+            (result, time.perf_counter() - start, time.process_time() - start_cpu)
+        )
+
+    return results
+
+
+def start_transform_pool(processes, user_mapping, default_user):
+    """Start the processes running transform_batch, or return None where fork is unavailable.
+
+    Processes are forked right away, so call it before starting any thread.
+    """
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return None
+
+    pool = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=init_transform,
+        initargs=(
+            label_rules,
+            ghutils.repo,
+            jirautils.gh_issue_field,
+            user_mapping,
+            default_user,
+        ),
+    )
+    # Fork start methods launch every process on the first submission
+    pool.submit(time.time).result()
+
+    return pool
@@ -0,0 +1,160 @@
+import utils.metricsutils as metricsutils
+import json
+import math
+
+
+# Estimates of a migration from the requests and bytes each issue will take.
+# Stages overlap in the pipeline, so the run lasts as long as its slowest host.
+top_count = 10
+
+
+def get_totals(costs):
+    """Return the sums of the numeric fields of the issue costs"""
+
+    totals = {}
+    for cost in costs:
+        for key, value in cost.items():
+            if isinstance(value, (int, float)):
+                totals[key] = totals.get(key, 0) + value
+
+    return totals
+
+
+def load_metrics(path):
+    """Return the run_metrics.json of a previous run, or None"""
+
+    try:
+        with open(path) as metrics_file:
+            return json.load(metrics_file)
+    except (OSError, ValueError):
+        return None
+
+
+def get_host_latencies(metrics):
+    """Return the mean request latency per host of run metrics"""
+
+    sums = {}
+    for endpoint, stats in metrics.get("endpoints", {}).items():
+        host = endpoint.split(" ", 1)[1].split("/", 1)[0]
+        total, count = sums.get(host, (0, 0))
+        sums[host] = (
+            total + stats["latency"]["sum"],
+            count + stats["latency"]["count"],
+        )
+
+    return {host: total / count for host, (total, count) in sums.items() if count}
+
+
+def get_host_requests(metrics, host):
+    """Return the number of requests sent to a host in run metrics"""
+
+    return sum(
+        stats["latency"]["count"]
+        for endpoint, stats in metrics.get("endpoints", {}).items()
+        if endpoint.split(" ", 1)[1].split("/", 1)[0] == host
+    )
+
+
+def get_upload_rate(metrics):
+    """Return the bytes per second of the attachment uploads of run metrics, or None"""
+
+    sent = 0
+    seconds = 0
+    for endpoint, stats in metrics.get("endpoints", {}).items():
+        if endpoint.startswith("POST ") and endpoint.endswith("/attachments"):
+            sent += stats["bytes_out"]
+            seconds += stats["latency"]["sum"]
+
+    return sent / seconds if sent and seconds else None
+
+
+def get_host_duration(requests, rate, latency, concurrency, transfer_seconds=0):
+    """Return the seconds the requests to a host take, bound by its rate or by latency"""
+
+    return max(requests / rate, (requests * latency + transfer_seconds) / concurrency)
+
+
+def get_issue_seconds(cost, jira_rate, download_rate, upload_rate=None):
+    """Return the share of the run spent on an issue"""
+
+    seconds = (cost["create"] + cost["comments"] + cost["uploads"]) / jira_rate
+    seconds += cost["downloads"] / download_rate
+    if upload_rate:
+        seconds += cost["upload_bytes"] / upload_rate
+
+    return seconds
+
+
+def format_duration(seconds):
+    """Return a duration such as 2 h 05 min or 40 s"""
+
+    seconds = math.ceil(seconds)
+    if seconds < 60:
+        return f"{seconds} s"
+    if seconds < 3600:
+        return f"{seconds // 60} min {seconds % 60:02d} s"
+    return f"{seconds // 3600} h {seconds // 60 % 60:02d} min"
+
+
+def get_upload_bytes(totals):
+    """Return the bytes to upload, counting uncached images at the mean size of the cached ones"""
+
+    known = totals.get("uploads", 0) - totals.get("unknown_sizes", 0)
+    if not known:
+        return totals.get("upload_bytes", 0)
+
+    return totals.get("upload_bytes", 0) * totals.get("uploads", 0) / known
+
+
+def print_plan(totals, hosts, writeback_seconds, costs, issue_seconds):
+    """Print the requests, projected duration and most expensive issues of a migration.
+
+    hosts maps a name to its requests, rate (per second) and duration.
+    """
+
+    print(
+        f"* Migration plan: {totals.get('create', 0)} Jira issues to create, "
+        f"{totals.get('comments', 0)} comments, {totals.get('uploads', 0)} attachments "
+        f"({metricsutils.format_size(totals.get('upload_bytes', 0))}"
+        + (
+            f", {totals['unknown_sizes']} not cached and of unknown size"
+            if totals.get("unknown_sizes")
+            else ""
+        )
+        + f"), {totals.get('writeback', 0)} GitHub write-backs"
+    )
+    print(
+        f"  {totals.get('downloads', 0)} images to download, "
+        f"{totals.get('duplicate', 0)} issues already linked in Jira skipped"
+    )
+
+    bounds = {}
+    for name, host in hosts.items():
+        print(
+            f"  {name}: {host['requests']} requests at {host['rate']:.1f}/s, "
+            f"{format_duration(host['duration'])}"
+        )
+        bounds[name] = host["duration"]
+    if writeback_seconds:
+        print(
+            f"  GitHub write-back pace: {totals.get('backlink', 0)} migration comments, "
+            f"{format_duration(writeback_seconds)}"
+        )
+        bounds["GitHub write-back pace"] = writeback_seconds
+
+    bottleneck = max(bounds, key=bounds.get)
+    print(
+        f"* Projected duration: {format_duration(bounds[bottleneck])} "
+        f"(bound by {bottleneck})"
+    )
+
+    ranked = sorted(zip(costs, issue_seconds), key=lambda item: item[1], reverse=True)[
+        :top_count
+    ]
+    if ranked:
+        print("* Most expensive issues:")
+    for cost, seconds in ranked:
+        print(
+            f"  {cost['url']}: {cost['comments']} comments, {cost['uploads']} attachments "
+            f"({metricsutils.format_size(cost['upload_bytes'])}), ~{format_duration(seconds)}"
+        )
@@ -0,0 +1,72 @@
+import utils.ghutils as ghutils
+import gzip
+import json
+import os
+
+
+# Gzipped JSON lines: a header line, then one issue per line with its comments,
+# keeping only the fields the mapping reads
+snapshot_version = 1
+compress_level = 6
+
+
+def compact_issue(issue, comments):
+    """Return the fields of an issue and its comments used by the migration"""
+
+    return {
+        "number": issue["number"],
+        "title": issue["title"],
+        "body": issue["body"],
+        "html_url": issue["html_url"],
+        "node_id": issue.get("node_id"),
+        "user": {"login": issue["user"]["login"]},
+        "labels": [{"name": label["name"]} for label in issue["labels"]],
+        "assignees": [{"login": assignee["login"]} for assignee in issue["assignees"]],
+        "comment_list": [
+            {
+                "id": comment.get("id"),
+                "user": {"login": comment["user"]["login"]},
+                "body": comment["body"],
+                "created_at": comment["created_at"],
+            }
+            for comment in comments
+        ],
+    }
+
+
+def write_snapshot(path, issues, header):
+    """Atomically write compacted issues to a snapshot file, return the number written"""
+
+    count = 0
+    with gzip.open(path + ".tmp", "wt", compresslevel=compress_level) as snapshot:
+        snapshot.write(json.dumps(dict(header, snapshot=snapshot_version)) + "\n")
+        for issue in issues:
+            snapshot.write(json.dumps(issue, separators=(",", ":")) + "\n")
+            count += 1
+    os.replace(path + ".tmp", path)
+
+    return count
+
+
+def read_header(path):
+    """Return the header of a snapshot file"""
+
+    with gzip.open(path, "rt") as snapshot:
+        header = json.loads(snapshot.readline())
+
+    if header.get("snapshot") != snapshot_version:
+        print(f"* Error: {path} is not a snapshot of version {snapshot_version}")
+        exit(1)
+
+    return header
+
+
+def iter_snapshot(path, label_exclusions=""):
+    """Yield the issues of a snapshot one line at a time, skipping excluded labels"""
+
+    with gzip.open(path, "rt") as snapshot:
+        snapshot.readline()
+        for line in snapshot:
+            issue = json.loads(line)
+            if not ghutils.has_label(issue, label_exclusions):
+                yield issue
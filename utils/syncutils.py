@@ -0,0 +1,40 @@
+from datetime import datetime, timezone
+import json
+import os
+
+
+# State kept between --sync runs: start time of the last complete sync and the
+# ETag of each page of issues returned by GitHub
+state_path = "sync_state.json"
+
+
+def load_state(path=None):
+    """Return the sync state, empty if no sync has completed yet"""
+
+    global state_path
+
+    if path:
+        state_path = path
+
+    state = {"last_sync": None, "etags": {}}
+    try:
+        with open(state_path) as state_file:
+            state.update(json.load(state_file))
+    except (OSError, ValueError):
+        pass
+
+    return state
+
+
+def save_state(state):
+    """Atomically write the sync state to disk"""
+
+    with open(state_path + ".tmp", "w") as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(state_path + ".tmp", state_path)
+
+
+def get_timestamp():
+    """Return the current time in the ISO 8601 format used by GitHub"""
+
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")